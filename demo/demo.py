@@ -33,14 +33,23 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import sys, math
+import sys, os
+from struct import Struct, error as StructError
 from os.path import dirname as dn, abspath
+from array import array
+from itertools import chain
+from operator import attrgetter
+from ctypes import Structure, sizeof, c_void_p
+from collections import defaultdict
 sys.path.append(dn(dn(abspath(__file__))))
 
 try:
     import pyglet
-    from pyglet.gl import GL_LINES, GL_FLOAT, GL_STATIC_DRAW, GL_UNSIGNED_SHORT
-    from pyglet.gl import glDrawElements, glClearColor, Config, glGenVertexArrays, glDeleteVertexArrays, glBindVertexArray, GLuint, glViewport
+    from pyglet.gl import GL_LINE_STRIP, GL_STATIC_DRAW, GL_UNSIGNED_SHORT, GL_PRIMITIVE_RESTART
+    from pyglet.gl import glDrawElements, glClearColor, Config, glGenVertexArrays, glDeleteVertexArrays, glBindVertexArray, GLuint, GLfloat, glViewport
+    from pyglet.gl import glEnable, glPrimitiveRestartIndex, glGetUniformBlockIndex, glUniformBlockBinding, glBindBufferBase
+    from pyglet.gl import GL_UNIFORM_BUFFER, GL_DYNAMIC_DRAW, glMapBufferRange, GLenum, GLsizeiptr, GLbitfield, gl_info
+    from pyglet.gl.lib import link_GL
     from pyglet.window import Window, mouse, key 
     from pyglet import app
 except (ImportError, ModuleNotFoundError) as _e:
@@ -50,11 +59,136 @@ except (ImportError, ModuleNotFoundError) as _e:
 import tinyblend as blend
 import pyshaders as shaders
 from pyglbuffers import Buffer
-from matmath import translate, perspective, rotate
+from matmath import perspective, store
 
 # Load the bindings in order to operate more easily with pyglbuffers
 shaders.load_extension('pyglbuffers_bindings')
 
+# Index that separates the line strips in the element buffer
+PRIMITIVE_RESTART = 0xFFFF
+
+def line_strips(edges):
+    """
+        Chain the (v1, v2) edges in line strips separated by PRIMITIVE_RESTART.
+        A strip is extended as long as its last vertex has an unused edge.
+    """
+    adjacency, count = defaultdict(list), 0
+    for index, (v1, v2) in enumerate(edges):
+        adjacency[v1].append((v2, index))
+        adjacency[v2].append((v1, index))
+        count += 1
+
+    # Strips have to start or end on the vertices with an odd number of edges, so they are tried first
+    starts = sorted(adjacency, key=lambda v: len(adjacency[v]) % 2 == 0)
+    used = bytearray(count)
+    strips = array('H')
+
+    for start in starts:
+        while True:
+            vertex, strip = start, [start]
+            while True:
+                links = adjacency[vertex]
+                while links and used[links[-1][1]]:
+                    links.pop()
+                if not links:
+                    break
+                vertex, index = links.pop()
+                used[index] = 1
+                strip.append(vertex)
+
+            if len(strip) == 1:
+                break
+
+            if len(strips) > 0:
+                strips.append(PRIMITIVE_RESTART)
+            strips.extend(strip)
+
+    return strips
+
+# Header of the mesh cache: cache format version, object name, blend file mtime and size,
+# mesh origin and scale, vertices and indices count
+MESH_CACHE_HEADER = Struct('=I64sdQ6dII')
+
+# Must be increased every time the layout of the cached mesh changes
+MESH_CACHE_VERSION = 1
+
+def parse_mesh(assets_path, name):
+    """
+        Read the mesh of the object "name" in a blend file and pack it for opengl.
+        Return the mesh origin, the mesh scale, the vertices and the indices.
+    """
+    assets = blend.BlenderFile(assets_path)
+    obj = assets.list('Object').find_by_name(name)
+
+    # Get the vertices data of the object
+    # The data is flattened in typed arrays in order to skip the creation of a tuple per vertex/edge
+    data = obj.data
+    # The fields are read with attrgetter to avoid running a python expression per vertex/edge
+    coords = array('f', chain.from_iterable(map(attrgetter('co'), data.mvert)))
+    # The edges are chained in line strips, this saves about 40% of the indices
+    indices = line_strips(map(attrgetter('v1', 'v2'), data.medge))
+
+    # Close the assets file
+    assets.close()
+
+    # The positions are packed as normalized shorts (8 bytes per vertex instead of 12)
+    # The bounding box is sent to the shader in order to expand them back
+    bounds = [(min(coords[i::3]), max(coords[i::3])) for i in range(3)]
+    mesh_origin = tuple((lo+hi)/2 for lo, hi in bounds)
+    mesh_scale = tuple(((hi-lo)/2) or 1.0 for lo, hi in bounds)
+
+    vertices = array('h', bytes(len(coords)//3*8))
+    for i in range(3):
+        origin, scale = mesh_origin[i], mesh_scale[i]
+        vertices[i::4] = array('h', [round((c-origin)/scale*32767) for c in coords[i::3]])
+
+    return mesh_origin, mesh_scale, vertices, indices
+
+def load_mesh(assets_path, name, cache_path):
+    """
+        Same as parse_mesh, but the result is saved in "cache_path". The cache is reused
+        as long as the object name, the cache format and the blend file mtime and size do not change.
+    """
+    stat = os.stat(assets_path)
+    # Blender names are at most 63 bytes long, the padding matches what Struct returns for "64s"
+    key = (MESH_CACHE_VERSION, name.encode('utf-8').ljust(64, b'\0'), stat.st_mtime, stat.st_size)
+
+    try:
+        with open(cache_path, 'rb') as f:
+            header = MESH_CACHE_HEADER.unpack(f.read(MESH_CACHE_HEADER.size))
+            if header[0:4] == key:
+                vertices, indices = array('h'), array('H')
+                vertices.fromfile(f, header[10])
+                indices.fromfile(f, header[11])
+                return header[4:7], header[7:10], vertices, indices
+    except (OSError, EOFError, StructError):
+        pass
+
+    mesh_origin, mesh_scale, vertices, indices = parse_mesh(assets_path, name)
+
+    # The cache is only an optimization, the demo still runs if it cannot be written
+    try:
+        with open(cache_path, 'wb') as f:
+            f.write(MESH_CACHE_HEADER.pack(*key, *mesh_origin, *mesh_scale, len(vertices), len(indices)))
+            vertices.tofile(f)
+            indices.tofile(f)
+    except OSError:
+        pass
+
+    return mesh_origin, mesh_scale, vertices, indices
+
+class Transforms(Structure):
+    " Content of the Transforms uniform block (std140 layout) "
+    _fields_ = (('proj', GLfloat*16), ('translation', GLfloat*3), ('pad0', GLfloat),
+                ('rotation', GLfloat*3), ('pad1', GLfloat))
+
+# Binding point of the Transforms uniform block
+TRANSFORMS_BINDING = 0
+
+# glBufferStorage (OpenGL 4.4 or GL_ARB_buffer_storage) is not exposed by pyglet
+GL_MAP_WRITE_BIT, GL_MAP_PERSISTENT_BIT, GL_MAP_COHERENT_BIT, GL_DYNAMIC_STORAGE_BIT = 0x0002, 0x0040, 0x0080, 0x0100
+glBufferStorage = link_GL('glBufferStorage', None, [GLenum, GLsizeiptr, c_void_p, GLbitfield], requires='OpenGL 4.4')
+
 class Game(Window):
 
     def __init__(self):
@@ -65,95 +199,123 @@ class Game(Window):
         context = config.create_context(None)
         
         Window.__init__(self, 800, 600, visible=False, resizable=True, caption='Tinyblend example', context=context)
-        
-        self.vao = (GLuint*1)()
-        glGenVertexArrays(1, self.vao)
-        glBindVertexArray(self.vao[0])
 
         # Load shaders
         shader = shaders.from_files_names('shaders/main.glsl.vert', 'shaders/main.glsl.frag')
         shader.owned = False
         shader.use()
-        shader.enable_all_attributes()
         self.shader = shader
 
-        # Uniforms matrices setup
-        self.rotation = [-90,0,0]
-        self.position = [0,0,-4.5]
-        shaders.transpose_matrices(False)
-        self.upload_uniforms()
+        # The uniforms updated by the demo are grouped in a uniform block, so they are sent in a single call
+        block_index = glGetUniformBlockIndex(shader.pid, b'Transforms')
+        glUniformBlockBinding(shader.pid, block_index, TRANSFORMS_BINDING)
+
+        self.transforms_buffer = Buffer.uniform('(16f)[proj](3f)[translation](1f)[pad0](3f)[rotation](1f)[pad1]', GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, TRANSFORMS_BINDING, self.transforms_buffer.bid)
+
+        self.persistent_transforms = False
+        if gl_info.have_extension('GL_ARB_buffer_storage'):
+            # The buffer is mapped once, the values are then written directly in memory visible by the GPU
+            # The storage also accepts glBufferSubData, which is used if the buffer cannot be mapped
+            # The storage is persistently mapped by the demo, so the buffer must not be mapped with Buffer.map
+            flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+            glBufferStorage(GL_UNIFORM_BUFFER, sizeof(Transforms), None, flags | GL_DYNAMIC_STORAGE_BIT)
+            self.transforms_buffer.storage_changed()
+
+            ptr = glMapBufferRange(GL_UNIFORM_BUFFER, 0, sizeof(Transforms), flags)
+            if ptr:
+                self.transforms = Transforms.from_address(ptr)
+                self.persistent_transforms = True
+            else:
+                # The storage is immutable, so it is only updated
+                self.transforms = Transforms()
+                self.transforms_buffer.update_from_bytes(self.transforms)
+        else:
+            self.transforms = Transforms()
+            self.transforms_buffer.init_from_bytes(self.transforms)
+
+        # The projection is built once with an aspect ratio of 1, only its first value depends on the window size
+        store(perspective(60.0, 1.0, 0.1, 256.0), self.transforms.proj)
+
+        # Camera and model parameters. These arrays share the memory of the uniform block values
+        self.proj = self.transforms.proj
+        self.rotation = self.transforms.rotation
+        self.rotation[::] = (-90,0,0)
+        self.position = self.transforms.translation
+        self.position[::] = (0,0,-4.5)
 
         # Scene creation
         self.setup_scene()
 
+        self.upload_projection()
+        self.uniforms_dirty = False
+
         # Show the window
         self.set_visible()
 
     def setup_scene(self):
         " Load the assets in the scene "
 
-        # Get the suzanne object from the blend file
-        assets = blend.BlenderFile('_assets.blend')
-        bsuzanne = assets.list('Object').find_by_name('Suzanne')
-
-        # Get the vertices data of the suzanne object
-        suz_data = bsuzanne.data
-        vertices, indices = [], []
-        
-        for v in suz_data.mvert:
-            vertices.append(v.co)
+        # The processed mesh is cached between runs, the blend file is only parsed when it changes
+        mesh_origin, mesh_scale, vertices, indices = load_mesh('_assets.blend', 'Suzanne', '_assets.cache')
 
-        for edge in suz_data.medge:
-            indices.append((edge.v1, edge.v2))
+        self.shader.uniforms.origin = mesh_origin
+        self.shader.uniforms.scale = mesh_scale
 
-        # Pack the vertices data of the suzanne object to be used by opengl
-        suzanne = Buffer.array('(3f)[position]', GL_STATIC_DRAW)
-        suzanne_indices = Buffer.element('(2S)[elem]', GL_STATIC_DRAW)
-        suzanne.init(vertices)
-        suzanne_indices.init(indices)
-        self.suzanne = (suzanne, suzanne_indices, len(suzanne_indices)*2)
+        # Upload the vertices data of the suzanne object, the arrays already match the buffer formats
+        suzanne = Buffer.array('(4sn)[position]', GL_STATIC_DRAW)
+        suzanne_indices = Buffer.element('(1S)[elem]', GL_STATIC_DRAW)
+        suzanne.init_from_bytes(vertices)
+        suzanne_indices.init_from_bytes(indices)
+        self.suzanne = (suzanne, suzanne_indices, len(suzanne_indices))
 
-        # Map the attribute and bind the buffer
+        # Record the attributes mapping and the buffers binding in a vertex array object
+        # Drawing the mesh only requires to bind it again
+        self.vao = (GLuint*1)()
+        glGenVertexArrays(1, self.vao)
+        glBindVertexArray(self.vao[0])
+        Buffer.invalidate_binding_cache()
+        self.shader.enable_all_attributes()
         suzanne.bind()
         suzanne_indices.bind()
         self.shader.map_attributes(suzanne)
+        glBindVertexArray(0)
+        Buffer.invalidate_binding_cache()
 
-        # Set the background color
+        # Set the background color and the strips separator
         glClearColor(0.1, 0.1, 0.1, 1.0)
-
-        # Close the assets file
-        assets.close()
+        glEnable(GL_PRIMITIVE_RESTART)
+        glPrimitiveRestartIndex(PRIMITIVE_RESTART)
 
     def upload_uniforms(self):
-        width, height = self.get_size()
-
-        uni = self.shader.uniforms
-        
-        uni.view = translate(None, tuple(self.position) )
-
-        mod_mat = rotate(None, self.rotation[0], (1.0, 0.0, 0.0))
-        mod_mat = rotate(mod_mat, self.rotation[1], (0.0, 0.0, 1.0))
-        uni.model = rotate(mod_mat, self.rotation[2], (0.0, 0.0, 1.0)) 
+        # The view and model matrices are composed in the vertex shader, only their parameters are uploaded
+        # If the buffer is persistently mapped, the values are already in the buffer
+        if not self.persistent_transforms:
+            self.transforms_buffer.update_from_bytes(self.transforms)
 
-        uni.proj = perspective(60.0, width/height, 0.1, 256.0)
+    def upload_projection(self):
+        " The projection only depends on the window size, so it is only updated on resize "
+        width, height = self.get_size()
+        self.proj[0] = self.proj[5] / (width/height)
+        self.upload_uniforms()
 
     def on_resize(self, width, height):
         glViewport(0,0, width, height)
-        self.upload_uniforms()
+        self.upload_projection()
 
     def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
         self.position[2] -= 0.3*scroll_y
-        self.upload_uniforms()
+        self.uniforms_dirty = True
 
     def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
         if buttons & mouse.LEFT != 0:
             self.rotation[0] += dy * 1.25
-            self.rotation[1] += dx * 1.25
+            self.rotation[2] += dx * 1.25
         elif buttons & mouse.RIGHT != 0:
             self.position[0] += dx * 0.005
             self.position[1] += dy * 0.005
 
-        self.upload_uniforms()
+        self.uniforms_dirty = True
 
     def on_key_press(self, sym, mod):
         if sym == key.ESCAPE:
@@ -163,11 +325,17 @@ class Game(Window):
             self.close()
 
     def on_draw(self):
+        # Upload the uniforms once per frame, no matter how many input events were received
+        if self.uniforms_dirty:
+            self.upload_uniforms()
+            self.uniforms_dirty = False
+
         # Clear the window
         self.clear()
 
         # Draw the mesh
-        glDrawElements(GL_LINES, self.suzanne[2], GL_UNSIGNED_SHORT, 0)
+        glBindVertexArray(self.vao[0])
+        glDrawElements(GL_LINE_STRIP, self.suzanne[2], GL_UNSIGNED_SHORT, 0)
     
 def main():
     game = Game()
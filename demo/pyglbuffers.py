@@ -26,15 +26,16 @@ SOFTWARE.
 from pyglet.gl import (glGenBuffers, glBindBuffer, GLuint, glBufferData,
   glIsBuffer, glDeleteBuffers, GLfloat, GLdouble, GLbyte, GLubyte, GLint,
   GLshort, GLushort, glGetBufferParameteriv, glGetBufferSubData, glBufferSubData,
-  glMapBuffer, glUnmapBuffer, glGetBufferPointerv)
+  glMapBuffer, glUnmapBuffer, glMapBufferRange)
 
 from pyglet.gl import (GL_ARRAY_BUFFER, GL_ELEMENT_ARRAY_BUFFER, GL_PIXEL_PACK_BUFFER,
   GL_PIXEL_UNPACK_BUFFER, GL_STATIC_COPY, GL_STATIC_DRAW, GL_STATIC_READ,
   GL_DYNAMIC_COPY, GL_DYNAMIC_DRAW, GL_DYNAMIC_READ, GL_STREAM_COPY, GL_STREAM_DRAW,
   GL_STREAM_READ, GL_TRUE, GL_BUFFER_SIZE, GL_READ_ONLY, GL_WRITE_ONLY, GL_READ_WRITE,
-  GL_BUFFER_MAPPED, GL_BUFFER_ACCESS, GL_BUFFER_USAGE, GL_BUFFER_MAP_POINTER, 
+  GL_BUFFER_MAPPED, GL_BUFFER_ACCESS, GL_BUFFER_USAGE, 
   GL_FLOAT, GL_DOUBLE, GL_BYTE, GL_UNSIGNED_BYTE, GL_INT, GL_UNSIGNED_INT,
-  GL_SHORT, GL_UNSIGNED_SHORT)
+  GL_SHORT, GL_UNSIGNED_SHORT, GL_UNIFORM_BUFFER, GL_MAP_WRITE_BIT, GL_MAP_INVALIDATE_BUFFER_BIT,
+  GL_MAP_UNSYNCHRONIZED_BIT)
 
 try:
     import pyglbuffers_extensions
@@ -44,10 +45,12 @@ except:
     NO_EXTENSIONS = True
 
 import re
-from ctypes import byref, Structure, cast, POINTER, sizeof, c_void_p
+from ctypes import byref, Structure, cast, POINTER, sizeof, c_void_p, memmove, addressof
 from functools import lru_cache, namedtuple
+from itertools import chain
 from collections.abc import Sequence
 from sys import modules
+from struct import Struct, error as StructError
 
 #Loaded extensions name are added in here
 LOADED_EXTENSIONS = []
@@ -56,54 +59,54 @@ BUFFER_FORMAT_TYPES_MAP = { 'f': (GLfloat, GL_FLOAT), 'd': (GLdouble, GL_DOUBLE)
                             'b': (GLbyte, GL_BYTE), 'B': (GLubyte, GL_UNSIGNED_BYTE),
                             'i': (GLint, GL_INT), 'I': (GLuint, GL_UNSIGNED_INT),
                             's': (GLshort, GL_SHORT), 'S': (GLushort, GL_UNSIGNED_SHORT)}
+
+# Format char of the ctypes types. Used to report the packing errors.
+BUFFER_FORMAT_CHARS = {t: k for k, (t, gl_type) in BUFFER_FORMAT_TYPES_MAP.items()}
                             
-pyvars = re.compile('[_a-zA-Z][_\w]+')
+# Struct format char of the ctypes types. Used to unpack the buffer data.
+STRUCT_FORMAT_CHARS = { GLfloat: 'f', GLdouble: 'd', GLbyte: 'b', GLubyte: 'B',
+                        GLint: 'i', GLuint: 'I', GLshort: 'h', GLushort: 'H'}
+
+pyvars = re.compile(r'[_a-zA-Z][_\w]*')
 
-map_info = namedtuple('MappingInformation', ['access', 'target', 'ptr', 'size'])
+map_info = namedtuple('MappingInformation', ['access', 'target', 'ptr', 'size', 'data'])
 
 def ptr_array(arr):
     " Cast an array in a pointer "
     return cast(arr, POINTER(arr._type_))
     
+def raw_data(data, struct_size):
+    """
+        Return an object that can be passed to the GL functions in place of a pointer to the memory of
+        "data" (any object supporting the buffer protocol) and its size in bytes. Writable buffers
+        (ex: numpy arrays, array.array, ctypes objects) and bytes are not copied.
+        Raise a ValueError if the size is not a multiple of "struct_size".
+    """
+    raw = memoryview(data).cast('B')
+    if len(raw) % struct_size != 0:
+        msg = 'Raw data size ({} bytes) is not a multiple of the format size ({} bytes)'
+        raise ValueError(msg.format(len(raw), struct_size))
+        
+    if not raw.readonly:
+        return (GLubyte*len(raw)).from_buffer(raw), len(raw)
+    elif type(data) is bytes:
+        # ctypes passes the address of the bytes content
+        return data, len(raw)
+        
+    return (GLubyte*len(raw)).from_buffer_copy(raw), len(raw)
+    
 def eval_index(index, length):
-    if index < 0 and index >= (-length) :  
-        return length+index
-    elif index >= length:
-        raise IndexError('Index "{}" out of bound, buffer has a length of "{}"'.format(index, length))
-    elif index < (-length):
-        raise IndexError('Index "{}" out of bound, buffer has a length of "{}"'.format(index, length))
-        
-    return index
+    if -length <= index < length:
+        return index % length
+        
+    raise IndexError('Index "{}" out of bound, buffer has a length of "{}"'.format(index, length))
 
 def eval_slice(slice, length):
-    _start = slice.start
-    _stop = slice.stop
-    step = slice.step
-    
-    if step is None: 
-        step = 1
-    elif step == 0:
+    " Return the start, stop and step of a slice over a buffer of \"length\" elements. Same rules as python sequences. "
+    if slice.step == 0:
         raise IndexError('Step cannot be 0')
         
-    if step < 1:
-        start, stop = _stop, _start 
-        if _start is None: start = length-1
-        if _stop is None: stop = 0     
-    else:
-        start, stop = _start, _stop   
-        if _start is None: start = 0
-        if _stop is None: stop = length      
-            
-    if start < 0: start = length+start   
-    if stop < 0: stop = length+stop
-
-    if start >= length or stop > length:
-        raise IndexError('Slices indexes "{}:{}" out of bound, buffer has a length of "{}"'.format(_start, _stop, length))
-        
-    if start < 0 or stop < 0:
-        raise IndexError('Slices indexes "{}:{}" out of bound, buffer has a length of "{}"'.format(_start, _stop, length))
-
-    return start, stop, step
+    return slice.indices(length)
 
 class BufferFormatError(Exception):
     def __init__(self, *args):
@@ -128,7 +131,7 @@ class GetBufferObject(GLGetObject):
     __slots__ = []
 
     def __get__(self, instance, cls):
-        instance.bind()
+        instance.bind(force=True)
         glGetBufferParameteriv(instance.target, self.pname, byref(self.buffer))
         return self.buffer.value
 
@@ -142,12 +145,29 @@ class BufferFormat(object):
             struct: ctypes struct representing this format
             item: named tuple representing this format
             tokens: Information on the formatted values fields
+            flat_type: ctypes type of the values if every token share the same type, else None
+            record: Struct object that reads the values of a packed element (padding included)
+            slices: (start, stop) of each token in the values read by record
+            stride: Size in bytes of a packed element
+            pack_one: Function that writes the values of an element in a struct. See from_string.
+            pack_value: Function that writes the value of an element in a struct if the format
+                        has a single token, else None. See pack.
+            pack_one_into: Function that writes the values of an element at an offset of a writable
+                           buffer with the record struct. The buffer may be partially written if
+                           the values are invalid. See Buffer.__setitem_mapped.
+            pack_value_into: Same as pack_one_into for the value of an element if the format has a
+                             single token, else None.
+            
+        Buffer formats are shared (see BufferFormat.new) and must not be modified.
+        Use clone() to get a copy.
     """
     
-    __fields__ = ['struct', 'item', 'tokens']
+    __fields__ = ['struct', 'item', 'tokens', 'flat_type', 'record', 'slices', 'stride', 'pack_one', 'pack_value',
+                  'pack_one_into', 'pack_value_into']
+    __slots__ = __fields__
     
-    pattern = re.compile(r'\((\d)+([fdbBsSiI])\)\[(\w+)\]')
-    token = namedtuple('FormatToken', ('offset', 'gl_type', 'size', 'type', 'name', ))
+    pattern = re.compile(r'\((\d+)([fdbBsSiI])(n?)\)\[(\w+)\]')
+    token = namedtuple('FormatToken', ('offset', 'gl_type', 'size', 'type', 'name', 'normalized'))
     
     @staticmethod
     def new(format):
@@ -158,30 +178,32 @@ class BufferFormat(object):
                 format: Data to build the format from.
         """
         if isinstance(format, BufferFormat):
-            format2 = BufferFormat()
-            for field in BufferFormat.__fields__:
-                setattr(format2, field, getattr(format, field))
+            return format
+        elif isinstance(format, str):
+            return BufferFormat.from_string(format)
             
-            format = format2
+        raise TypeError("Format must be a string or a BufferFormat object.")
+        
+    def clone(self):
+        " Return a copy of the buffer format "
+        format = super().__new__(type(self))
+        for field in BufferFormat.__fields__:
+            setattr(format, field, getattr(self, field))
             
-        elif isinstance(format, str):
-            format = BufferFormat.from_string(format)
-        else:
-            raise TypeError("Format must be a string or a BufferFormat object.")
-    
         return format
     
     
     @classmethod
-    @lru_cache(maxsize=16)
+    @lru_cache(maxsize=256)
     def from_string(cls, format_str):
         """ 
             Create a buffer format from a string. Generated buffer format are
             cached, so this function is not expensive to call.
             
             A format string is composed of N format token.
-            A format token follow these rules: ({number}{format char})[{name}]
-            Whitespaces are ignored.
+            A format token follow these rules: ({number}{format char}{n})[{name}]
+            Whitespaces are ignored. The "n" suffix is optional and mark integer values
+            that must be normalized when read by the shaders (ex: a short mapped to [-1.0, 1.0]).
             
             Available format char:
               f: float
@@ -196,32 +218,39 @@ class BufferFormat(object):
             Example:
                 "(3i)[vertex](4f)[color]"
                 "(4f)[foo] (4f)[bar] (4d)[yolo]"
+                "(4sn)[position] (4Bn)[color]"
         """
         format_str = format_str.replace(' ', '')
-        format_str_2 = ""
         
         if len(format_str) == 0:
             raise BufferFormatError('Format must be present')
         
         # Create the tokens
-        tokens, offset = [], 0
+        # pos is the end of the last token, the format is invalid if there is something between two tokens
+        tokens, offset, pos = [], 0, 0
+        types_map, name_match = BUFFER_FORMAT_TYPES_MAP, pyvars.fullmatch
         for match in BufferFormat.pattern.finditer(format_str):
+            if match.start() != pos:
+                raise BufferFormatError('Format string is not valid')
+            pos = match.end()
             groups = match.groups()
             
-            _type, gl_type = BUFFER_FORMAT_TYPES_MAP.get(groups[1])
+            _type, gl_type = types_map[groups[1]]
             size=int(groups[0])
             
-            name=groups[2]
-            name_match = pyvars.match(name)
-            if name_match is None or name_match.span() != (0, len(name)):
+            normalized = groups[2] == 'n'
+            if normalized and groups[1] in 'fd':
+                raise BufferFormatError('Floating point values cannot be normalized')
+            
+            name=groups[3]
+            if name_match(name) is None:
                 raise ValueError('"{}" is not a valid variable name'.format(name))
             
-            token = BufferFormat.token(size=size, type=_type*size, name=name, gl_type=gl_type, offset=offset)
+            token = BufferFormat.token(size=size, type=_type*size, name=name, gl_type=gl_type, offset=offset, normalized=normalized)
             tokens.append(token)
             offset += sizeof(token.type)
-            format_str_2 += format_str[match.start():match.end()]
             
-        if format_str_2 != format_str:
+        if pos != len(format_str):
             raise BufferFormatError('Format string is not valid')
                 
         bformat = super().__new__(cls)
@@ -235,82 +264,160 @@ class BufferFormat(object):
         # Build the structure
         struct_fields = [(t.name, t.type) for t in tokens]
         bformat.struct = type('BufferStruct', (Structure,), {'_fields_': struct_fields})
+        bformat.stride = stride = sizeof(bformat.struct)
+        
+        # If all the values have the same type (and so no padding is added in the struct), 
+        # the data can be packed in a flat array of that type. See pack.
+        value_types = set(t.type._type_ for t in tokens)
+        bformat.flat_type = value_types.pop() if len(value_types) == 1 else None
+        
+        # Build the struct used to unpack the data. The padding added by ctypes is skipped with pad bytes.
+        record_fmt, record_offset, slices = '=', 0, []
+        for t in tokens:
+            field_offset = getattr(bformat.struct, t.name).offset
+            if field_offset > record_offset:
+                record_fmt += '{}x'.format(field_offset-record_offset)
+            record_fmt += '{}{}'.format(t.size, STRUCT_FORMAT_CHARS[t.type._type_])
+            record_offset = field_offset + sizeof(t.type)
+            start = slices[-1][1] if len(slices) > 0 else 0
+            slices.append((start, start+t.size))
+            
+        if stride > record_offset:
+            record_fmt += '{}x'.format(stride-record_offset)
+        bformat.record = Struct(record_fmt)
+        bformat.slices = tuple(slices)
+        
+        # Generate the functions that fill a struct with the values of an element. Assigning the fields
+        # one by one is faster than looping over the tokens. The token names cannot be python keywords,
+        # those are rejected by namedtuple.
+        source = ['def pack_one(buffer, values):']
+        source.extend('    buffer.{} = T{}(*values[{}])'.format(t.name, i, i) for i, t in enumerate(tokens))
+        if len(tokens) == 1:
+            source.append('def pack_value(buffer, value):')
+            source.append('    buffer.{} = T0(*value)'.format(tokens[0].name))
+        
+        # The "into" functions write the values in memory with the record struct, without going through
+        # a ctypes struct. The values are unpacked in variables first, so that a value with the wrong
+        # size raises an error instead of shifting the next values.
+        values = [['v{}_{}'.format(i, j) for j in range(t.size)] for i, t in enumerate(tokens)]
+        flat_values = ', '.join(chain.from_iterable(values))
+        source.append('def pack_one_into(view, offset, values):')
+        source.append('    {}, = values'.format(', '.join('({},)'.format(', '.join(v)) for v in values)))
+        source.append('    pack_into(view, offset, {})'.format(flat_values))
+        if len(tokens) == 1:
+            source.append('def pack_value_into(view, offset, value):')
+            source.append('    {}, = value'.format(', '.join(values[0])))
+            source.append('    pack_into(view, offset, {})'.format(flat_values))
+            
+        namespace = {'T{}'.format(i): t.type for i, t in enumerate(tokens)}
+        namespace['pack_into'] = bformat.record.pack_into
+        exec('\n'.join(source), namespace)
+        bformat.pack_one = namespace['pack_one']
+        bformat.pack_value = namespace.get('pack_value')
+        bformat.pack_one_into = namespace['pack_one_into']
+        bformat.pack_value_into = namespace.get('pack_value_into')
         
         return bformat
         
     def pack(self, data):
         """
             Pack python sequence into a c struct. The data must match the
-            BufferFormat format.
-            
+            BufferFormat format. Data that is already packed must be uploaded
+            with Buffer.init_from_bytes or Buffer.update_from_bytes instead.
+
             Argument:
-                data: Sequence of python data. 
+                data: Sequence of python data.
         """
         if len(data) == 0:
             raise ValueError('No data to pack')
+
+        # Allow single tuple when there is only one token
+        # Ex: ((1,2,3), (4,5,6)) is accepted instead of (((1,2,3),), ((4,5,6),))
+        single = self.pack_value is not None and not isinstance(data[0][0], Sequence)
         
+        if self.flat_type is not None:
+            buffers = self.pack_flat(data, single)
+            if buffers is not None:
+                return buffers
+                
         buffers = (self.struct*len(data))()
         
-        # Allow single tuple when there is only one token
-        # Ex: ((1,2,3), (4,5,6)) is accepted instead of (((1,2,3),), ((4,5,6),))
-        if len(self.tokens) > 1 or isinstance(data[0][0], Sequence):
-            iter_data = iter(data)
-        else:
-            iter_data = ((d,) for d in data)
-
+        pack_one = self.pack_value if single else self.pack_one
         try:
-            error = False
-            for data, buffer in zip(iter_data, iter(buffers)):
-                for subdata, token in zip(iter(data), iter(self.tokens)):
-                    setattr(buffer, token.name, token.type(*subdata))
-                    
-        except TypeError:
-            error = True
-            
-        if error:
-            msg = 'Expected Sequence with format "{}", found "{}"'
-            
-            for k, v in BUFFER_FORMAT_TYPES_MAP.items():
-                if v is token.type._type_:
-                    format_str = str(token.size)+k
-    
-            raise ValueError(msg.format(format_str, subdata))
+            for values, buffer in zip(data, buffers):
+                pack_one(buffer, values)
+        except (TypeError, IndexError):
+            raise self.pack_error((values,) if single else values) from None
         
         return buffers
         
-    def pack_single(self, data):
+    def pack_flat(self, data, single):
+        """
+            Pack the data in a flat array of "flat_type" and cast it to an array of struct.
+            Return None if the data do not match the format, in which case the data is packed
+            by pack in order to report the error.
+        """
+        count = len(data)
+        try:
+            if single:
+                # Every value must have the token size, otherwise they would be shifted in the buffer
+                if set(map(len, data)) != {self.tokens[0].size}:
+                    return None
+                values = list(chain.from_iterable(data))
+            else:
+                # Same for every token of every element
+                sizes = tuple(t.size for t in self.tokens)
+                if any(tuple(map(len, element)) != sizes for element in data):
+                    return None
+                values = list(chain.from_iterable(chain.from_iterable(data)))
+            
+            if len(values) != count * self.stride // sizeof(self.flat_type):
+                return None
+        
+            flat = (self.flat_type*len(values))(*values)
+        except TypeError:
+            return None
+            
+        return (self.struct*count).from_buffer(flat)
+        
+    def pack_single(self, data, buffer=None):
         """
             Pack a python value into a c struct. The value must match
             the BufferFormat format.
             
             Argument:
                 data: Python value. 
+                buffer: Struct to pack the value into. If None, a new struct is allocated.
         """
+        buffer = buffer if buffer is not None else self.struct()
         try:
             # Allow single tuple when there is only one token
             # Ex: (1,2,3) is accepted instead of ((1,2,3),)
-            if len(self.tokens) == 1 and not isinstance(data[0], Sequence):
-                data = (data,)                
-                
-            buffer = self.struct()
-            error = False
-            for subdata, token in zip(iter(data), iter(self.tokens)):
-                setattr(buffer, token.name, token.type(*subdata))
+            if self.pack_value is not None and not isinstance(data[0], Sequence):
+                data = (data,)
                 
-        except TypeError:
-            error = True
-            
-        if error:
-            msg = 'Expected Sequence with format "{}", found "{}"'
-            
-            for k, v in BUFFER_FORMAT_TYPES_MAP.items():
-                if v is token.type._type_:
-                    format_str = str(token.size)+k
-    
-            raise ValueError(msg.format(format_str, subdata))
+            self.pack_one(buffer, data)
+        except (TypeError, IndexError):
+            raise self.pack_error(data) from None
         
         return buffer
         
+    def pack_error(self, values):
+        " Return the error raised by pack and pack_single when the values of an element do not match the format "
+        msg = 'Expected Sequence with format "{}", found "{}"'
+        
+        if not isinstance(values, Sequence):
+            values = (values,)
+        
+        for token, subdata in zip(self.tokens, chain(values, [None]*len(self.tokens))):
+            try:
+                token.type(*subdata)
+            except (TypeError, IndexError):
+                break
+        
+        format_str = str(token.size)+BUFFER_FORMAT_CHARS[token.type._type_]
+        return ValueError(msg.format(format_str, subdata))
+        
         
     def unpack(self, data):
         """
@@ -323,15 +430,16 @@ class BufferFormat(object):
         if len(data) > 0 and not isinstance(data[0], self.struct):
             raise ValueError("Impossible to unpack data that was not packed by the formatter")
         
-        data_dict = {}
-        unpack_data = []
-        for d in data:
-            for t in self.tokens:
-                data_dict[t.name] = tuple(getattr(d, t.name))
-            
-            unpack_data.append(self.item(**data_dict))
+        # Arrays of struct are read in one pass by the record struct. Other sequences (ex: a list
+        # returned by slicing an array) are read element by element.
+        try:
+            values = self.record.iter_unpack(memoryview(data).cast('B'))
+        except TypeError:
+            unpack_from = self.record.unpack_from
+            values = (unpack_from(d) for d in data)
         
-        return tuple(unpack_data)
+        item, slices = self.item, self.slices
+        return tuple([item(*[v[a:b] for a, b in slices]) for v in values])
         
     def unpack_single(self, data):
         """
@@ -344,11 +452,30 @@ class BufferFormat(object):
         if not isinstance(data, self.struct):
             raise ValueError("Impossible to unpack data that was not packed by the formatter")
             
-        data_dict = {}
-        for t in self.tokens:
-            data_dict[t.name] = tuple(getattr(data, t.name))
+        values = self.record.unpack_from(data)
+        return self.item(*[values[a:b] for a, b in self.slices])
         
-        return self.item(**data_dict)
+    def unpack_indexed(self, data, indices):
+        """
+            Unpack the elements of an array of ctypes struct at "indices" in named tuples.
+            The elements are read from the array memory, without creating a struct object for each of them.
+            
+            Argument:
+                data: array of ctypes struct 
+                indices: range of the elements to unpack
+        """
+        if getattr(data, '_type_', None) is not self.struct:
+            raise ValueError("Impossible to unpack data that was not packed by the formatter")
+            
+        raw, stride = memoryview(data).cast('B'), self.stride
+        if indices.step == 1:
+            values = self.record.iter_unpack(raw[indices.start*stride:indices.stop*stride])
+        else:
+            unpack_from = self.record.unpack_from
+            values = (unpack_from(raw, i*stride) for i in indices)
+            
+        item, slices = self.item, self.slices
+        return tuple([item(*[v[a:b] for a, b in slices]) for v in values])
             
 class Buffer(object):
     """
@@ -359,11 +486,19 @@ class Buffer(object):
             data: Object that allows pythonic access to the buffer data
             target: Buffer target (ex: GL_ARRAY_BUFFER)
             owned: If the object own the underlying data
+            mapinfo: Mapping information (see map_info) or None if the buffer is not mapped.
+                     "data" is a ctypes array over the mapped memory.
     """
 
     __slots__ = ['bid', 'format', 'target', '_usage', 'data', 'owned',
-                 '__weakref__', 'mapinfo']    
+                 '__weakref__', 'mapinfo', '_size', '_scratch']    
+    
+    # Buffer currently bound to each target, as {target: buffer id}. Used to skip redundant glBindBuffer calls.
+    # See invalidate_binding_cache.
+    _bound = {}
     
+    # The values below are queried from opengl on every access. The buffer size and mapped state are
+    # also tracked by the object itself (see "_size" and "mapinfo"), which is what the methods use.
     size = GetBufferObject(GL_BUFFER_SIZE)    
     mapped = GetBufferObject(GL_BUFFER_MAPPED)
     access = GetBufferObject(GL_BUFFER_ACCESS)
@@ -376,6 +511,8 @@ class Buffer(object):
         self.format = BufferFormat.new(format)
         self.target = None
         self.mapinfo = None
+        self._size = None
+        self._scratch = bytearray()
 
     @staticmethod
     def __alloc(cls, target, format, usage): 
@@ -384,10 +521,13 @@ class Buffer(object):
         buf.bid = GLuint()
         glGenBuffers(1, byref(buf.bid))
         glBindBuffer(target, buf.bid)
+        Buffer._bound[target] = buf.bid.value
         buf._usage = usage
         buf.format = BufferFormat.new(format)
         buf.target = target
         buf.mapinfo = None
+        buf._size = 0
+        buf._scratch = bytearray()
         
         return buf
         
@@ -416,24 +556,56 @@ class Buffer(object):
            like glTexImage2D() (GL_PIXEL_UNPACK_BUFFER)
        """
        return Buffer.__alloc(cls, GL_PIXEL_UNPACK_BUFFER, format, usage)
+       
+    @classmethod
+    def uniform(cls, format, usage=GL_DYNAMIC_DRAW):
+       """
+           Generate a buffer that hold the values of an uniform block (GL_UNIFORM_BUFFER).
+           The format must include the padding required by the block layout (ex: std140)
+       """
+       return Buffer.__alloc(cls, GL_UNIFORM_BUFFER, format, usage)
     
     def valid(self):
         " Return True if the underlying opengl buffer is valid or False if it is not "
         return glIsBuffer(self.bid) == GL_TRUE
         
-    def bind(self, target=None):
+    def bind(self, target=None, force=False):
         """
             Bind the buffer to its target
         
             Arguments:
                 target: Default to None. One of the GL target (such as GL_ARRAY_BUFFER)
                         If None, use the default buffer target.
+                force: Default to False. If True, glBindBuffer is called even if the binding cache
+                       reports the buffer as bound. The methods that read, write or map the buffer
+                       storage always force the binding, so a stale cache cannot make them use another buffer.
         """
         if self.target is None:
             raise ValueError("Buffer target was not defined")
             
         target = target if target is not None else self.target
-        glBindBuffer(target, self.bid)
+        if force or Buffer._bound.get(target) != self.bid.value:
+            glBindBuffer(target, self.bid)
+            Buffer._bound[target] = self.bid.value
+            
+    @staticmethod
+    def invalidate_binding_cache():
+        """
+            Forget the buffers bound by this module. This must be called when the buffer bindings
+            are changed outside of pyglbuffers, for example after glBindBuffer, after binding a
+            vertex array object (the element buffer binding is part of the vertex array state) or
+            after switching the GL context. Only Buffer.bind relies on the cache, the methods that
+            access the buffer storage always bind the buffer.
+        """
+        Buffer._bound.clear()
+        
+    def storage_changed(self):
+        """
+            Forget the buffer size tracked by this object. This must be called when the buffer storage
+            is allocated outside of pyglbuffers (ex: with glBufferStorage). The size is then queried
+            from opengl the next time it is needed.
+        """
+        self._size = None
         
     def map(self, access=GL_READ_WRITE, target=None):
         """
@@ -444,28 +616,30 @@ class Buffer(object):
             access: Buffer access. Can be GL_READ_WRITE, GL_READ_ONLY, GL_WRITE_ONLY. Default to GL_READ_WRITE
             target: Target to bind the buffer to. If None, use the buffer default target. Default to None.
         """
-        if self.mapped == GL_TRUE:
+        if self.mapinfo is not None:
             raise BufferError("Buffer is already mapped")
         
         target = target if target is not None else self.target
-        glBindBuffer(target, self.bid)
-        glMapBuffer(target, access)
+        self.bind(target, force=True)
+        ptr = glMapBuffer(target, access)
+        if not ptr:
+            raise BufferError("Buffer could not be mapped")
         
         ptr_type = POINTER(self.format.struct)
-        ptr = c_void_p()
-        glGetBufferPointerv(target, GL_BUFFER_MAP_POINTER, byref(ptr))        
-        
-        self.mapinfo = map_info(target=target, access=access, ptr=cast(ptr,ptr_type),
-                                size=self.size//sizeof(self.format.struct))
+        size = len(self)
+        data = (GLubyte*(size*self.format.stride)).from_address(ptr)
+        self.mapinfo = map_info(target=target, access=access, ptr=cast(c_void_p(ptr), ptr_type),
+                                size=size, data=data)
         
     def unmap(self):
         """
             Unmap the buffer. Will raise a BufferError if the buffer is not mapped.
         """
         
-        if self.mapped != GL_TRUE:
+        if self.mapinfo is None:
             raise BufferError("Buffer is not mapped")
             
+        self.bind(self.mapinfo.target, force=True)
         glUnmapBuffer(self.mapinfo.target)
         self.mapinfo = None
         
@@ -484,9 +658,62 @@ class Buffer(object):
         if target is None:
             target = self.target
             
-        self.bind(target)
+        self.bind(target, force=True)
         cdata = self.format.pack(data)
-        glBufferData(target, sizeof(cdata), ptr_array(cdata), self._usage)
+        self.__upload(target, cdata, sizeof(cdata))
+        self._size = sizeof(cdata)
+        
+    def __upload(self, target, cdata, size):
+        """
+            Allocate a new storage of "size" bytes for the buffer bound to "target" and
+            fill it with "cdata". The storage is mapped and written directly, which avoids
+            the copy made by the driver when the data is passed to glBufferData.
+        """
+        glBufferData(target, size, c_void_p(0), self._usage)
+        
+        flags = GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT | GL_MAP_UNSYNCHRONIZED_BIT
+        ptr = glMapBufferRange(target, 0, size, flags)
+        if ptr:
+            memmove(ptr, cdata, size)
+            if glUnmapBuffer(target) == GL_TRUE:
+                return
+        
+        # The buffer could not be mapped or its content was lost while it was mapped
+        glBufferSubData(target, 0, size, cdata)
+        
+    def init_from_bytes(self, data, target=None):
+        """
+            Fill the buffer data with the raw content of "data". Data can be any object
+            supporting the buffer protocol (bytes, array.array, numpy arrays, ctypes arrays, ...)
+            and must already be laid out using the buffer format. Unlike init(), the data
+            is not packed before being sent to glBufferData.
+            
+            Parameters:
+                data: Data to use to initialize the buffer.
+        """
+        if target is None:
+            target = self.target
+            
+        cdata, size = raw_data(data, self.format.stride)
+        self.bind(target, force=True)
+        self.__upload(target, cdata, size)
+        self._size = size
+        
+    def update_from_bytes(self, data, offset=0, target=None):
+        """
+            Overwrite the buffer content starting at the element "offset" with the raw content
+            of "data". This calls glBufferSubData, see init_from_bytes for the accepted data.
+            
+            Parameters:
+                data: Data to write in the buffer.
+                offset: Index of the first element to overwrite. Default to 0.
+        """
+        if target is None:
+            target = self.target
+            
+        cdata, size = raw_data(data, self.format.stride)
+        self.bind(target, force=True)
+        glBufferSubData(target, offset*self.format.stride, size, cdata)
         
     def reserve(self, length, target=None):
         """
@@ -498,9 +725,20 @@ class Buffer(object):
         if target is None:
             target = self.target
             
-        self.bind()
-        glBufferData(target, sizeof(self.format.struct)*length, c_void_p(0), self._usage)
+        self.bind(target, force=True)
+        glBufferData(target, self.format.stride*length, c_void_p(0), self._usage)
+        self._size = self.format.stride*length
     
+    def __scratch(self, size):
+        """
+            Return a memory area of at least "size" bytes used to read or write the buffer data.
+            The area is reused by the next calls, so it must not be referenced once the data was copied.
+        """
+        if len(self._scratch) < size:
+            self._scratch = bytearray(size)
+            
+        return self._scratch
+        
     def __getitem_mapped(self, buffer, key):
         " Called by __getitem__ if the buffer content is mapped locally "
         info = buffer.mapinfo
@@ -513,8 +751,9 @@ class Buffer(object):
             key = eval_index(key, blen)
             return buffer.format.unpack_single(info.ptr[key])
         else: 
-            start, stop, step = eval_slice(key, blen)
-            return buffer.format.unpack(info.ptr[start:stop:step])
+            indices = range(*eval_slice(key, blen))
+            data = (buffer.format.struct*blen).from_address(addressof(info.ptr.contents))
+            return buffer.format.unpack_indexed(data, indices)
         
     def __setitem_mapped(self, buffer, key, value):
         " Called by __setitem__ if the buffer content is mapped locally "
@@ -526,16 +765,41 @@ class Buffer(object):
         
         if isinstance(key, int):
             key = eval_index(key, blen)
-            info.ptr[key] = buffer.format.pack((value,))[0]
+            format, stride = buffer.format, buffer.format.stride
+            try:
+                # The value is packed in the scratch area first, so that an invalid value does not leave
+                # a partially written element in the mapped memory
+                scratch = buffer.__scratch(stride)
+                if format.pack_value_into is not None and not isinstance(value[0], Sequence):
+                    format.pack_value_into(scratch, 0, value)
+                else:
+                    format.pack_one_into(scratch, 0, value)
+            except (TypeError, ValueError, OverflowError, StructError):
+                # Let ctypes convert the values (ex: out of range integers) or report the error
+                info.ptr[key] = format.pack_single(value)
+            else:
+                memmove(addressof(info.data) + key*stride, (GLubyte*stride).from_buffer(scratch), stride)
         else: 
-            start, stop, step = eval_slice(key, blen)
-            if step == -1:
-                value = list(reversed(value))
-                step = 1
+            indices = range(*eval_slice(key, blen))
+            if len(indices) != len(value):
+                raise ValueError("Buffer do not support resizing")
+            if len(indices) == 0:
+                return
+            
+            # Values are written in increasing order
+            if indices.step < 0:
+                indices, value = indices[::-1], list(reversed(value))
                 
-            # Ctypes pointers do not support slicing assignment
-            for count, i in enumerate(range(start, stop, step)):
-                info.ptr[i] = buffer.format.pack((value[count],))[0]
+            # The values are packed once, contiguous slices are then copied in a single call
+            packed = buffer.format.pack(value)
+            if indices.step == 1:
+                struct_size = buffer.format.stride
+                memmove(addressof(info.ptr.contents) + indices.start*struct_size, packed, sizeof(packed))
+            else:
+                # Ctypes pointers do not support slicing assignment
+                ptr = info.ptr
+                for i, element in zip(indices, packed):
+                    ptr[i] = element
     
     def __getitem__(self, key):
         if not isinstance(key, int) and not isinstance(key, slice):
@@ -544,28 +808,31 @@ class Buffer(object):
         if self.mapinfo is not None:
             return self.__getitem_mapped(self, key)
 
-        self.bind()            
+        format, target = self.format, self.target
+        self.bind(force=True)
         blen = len(self) 
        
         if isinstance(key, int):
             key = eval_index(key, blen)
             
-            buf = self.format.struct()
-            buf_size = sizeof(buf)
-            glGetBufferSubData(self.target, key*buf_size, buf_size, byref(buf))
+            buf = format.struct.from_buffer(self.__scratch(format.stride))
+            glGetBufferSubData(target, key*format.stride, format.stride, byref(buf))
             
-            return self.format.unpack_single(buf)
+            return format.unpack_single(buf)
         
         else:
-            start, stop, step = eval_slice(key, blen)
-            buf_len = stop-start
-            buf = (self.format.struct*buf_len)()
-            buf_size = sizeof(buf)
-            buf_offset = start * sizeof(self.format.struct)
+            indices = range(*eval_slice(key, blen))
+            if len(indices) == 0:
+                return ()
+                
+            # Read all the elements between the first and the last index, then keep the ones in the slice
+            first, last = min(indices[0], indices[-1]), max(indices[0], indices[-1])
+            buf_len = last-first+1
+            buf = (format.struct*buf_len).from_buffer(self.__scratch(buf_len*format.stride))
             
-            glGetBufferSubData(self.target, buf_offset, buf_size, byref(buf))
+            glGetBufferSubData(target, first*format.stride, buf_len*format.stride, byref(buf))
             
-            return self.format.unpack(buf[::step])
+            return format.unpack_indexed(buf, range(indices.start-first, indices.stop-first, indices.step))
             
     def __setitem__(self, key, value):
         if not isinstance(key, int) and not isinstance(key, slice):
@@ -574,31 +841,48 @@ class Buffer(object):
         if self.mapinfo is not None:
             return self.__setitem_mapped(self, key, value)
 
-        self.bind()
+        format, target = self.format, self.target
+        stride = format.stride
+        self.bind(force=True)
         blen = len(self)            
             
         if isinstance(key, int):
             key = eval_index(key, blen)
-            buf = self.format.pack((value,))
-            buf_size = sizeof(buf)
-            glBufferSubData(self.target, key*buf_size, buf_size, byref(buf))
+            buf = format.pack_single(value, format.struct.from_buffer(self.__scratch(stride)))
+            glBufferSubData(target, key*stride, stride, byref(buf))
             
-        else:
-            if key.step is not None and key.step not in (1, -1):
-                raise NotImplementedError('Unmapped buffer write do not support steps different than 1.')
-            if key.step == -1:
-                value = list(reversed(value))                
-                
-            start, stop, step = eval_slice(key, blen)
-            if stop-start != len(value):
+        elif key.step is not None and key.step not in (1, -1):
+            # glBufferSubData cannot write strided values, so the covered range is mapped and written in one go
+            indices = range(*eval_slice(key, blen))
+            if len(indices) != len(value):
                 raise ValueError("Buffer do not support resizing")
+            if len(indices) == 0:
+                return
                 
-            buf = self.format.pack(value)
-            buf_size = sizeof(self.format.struct) * (stop-start)
-            buf_offset = start * sizeof(self.format.struct)
+            first, last = min(indices[0], indices[-1]), max(indices[0], indices[-1])
+            packed = format.pack(value)
+            
+            ptr = glMapBufferRange(target, first*stride, (last-first+1)*stride, GL_MAP_WRITE_BIT)
+            if not ptr:
+                raise BufferError("Buffer could not be mapped")
                 
+            mapped = cast(ptr, POINTER(format.struct))
+            for i, element in zip(indices, packed):
+                mapped[i-first] = element
+            glUnmapBuffer(target)
             
-            glBufferSubData(self.target, buf_offset, buf_size, byref(buf))
+        else:
+            indices = range(*eval_slice(key, blen))
+            if len(indices) != len(value):
+                raise ValueError("Buffer do not support resizing")
+            if len(indices) == 0:
+                return
+                
+            if indices.step < 0:
+                indices, value = indices[::-1], list(reversed(value))
+                
+            buf = format.pack(value)
+            glBufferSubData(target, indices.start*stride, stride*len(indices), byref(buf))
             
     def __repr__(self):
         return repr(self[::])
@@ -617,15 +901,35 @@ class Buffer(object):
         return self.valid() 
         
     def __len__(self):
-        return self.size//sizeof(self.format.struct)
+        # The size of a buffer that was not allocated by this object is queried once
+        size = self._size
+        if size is None:
+            size = self._size = self.size
+            
+        return size//self.format.stride
         
     def __del__(self):
-        if getattr(self, 'owned', False) and self.valid():
-            if self.mapped == GL_TRUE:
-                self.unmap()
+        if not getattr(self, 'owned', False):
+            return
+            
+        # glDeleteBuffers ignores the names that are not buffers, so the buffer is not validated first.
+        # Errors are ignored because the GL context or the module globals may already be gone
+        # when the buffer is collected during the interpreter shutdown.
+        try:
+            if self.mapinfo is not None:
+                self.bind(self.mapinfo.target, force=True)
+                glUnmapBuffer(self.mapinfo.target)
+                self.mapinfo = None
             
             glDeleteBuffers(1, byref(self.bid))
             
+            # A deleted buffer is unbound from all its targets
+            bound = Buffer._bound
+            for target in [t for t, bid in bound.items() if bid == self.bid.value]:
+                del bound[target]
+        except Exception:
+            pass
+            
 
 def extension_loaded(extension_name):
     """
@@ -44,7 +44,7 @@ def map_attributes(self, buffer):
         The buffer format names must match the shader attributes.
         Attributes that cannot be mapped will not be touched.
         
-        Normalized is set to false.
+        Normalized is set to true for the format tokens with the "n" suffix (ex: "(4sn)[foo]").
         
         If the buffer format is not supported by opengl, an error will be raised.
         Ex: "(6D)[foo]"
@@ -61,7 +61,7 @@ def map_attributes(self, buffer):
                               
     for token, attr in buffer_attributes:
         offset, type, size = token[0:3]    # Tokens attributes are aligned with the point_to parameters
-        attr.point_to(offset, type, size, False, stride)  
+        attr.point_to(offset, type, size, token.normalized, stride)  
     
     
 def supported():
@@ -1,13 +1,32 @@
 #version 330
 
-layout (location = 0) in vec3 position;
+layout (location = 0) in vec4 position;
 
-uniform mat4 view;
-uniform mat4 model;
-uniform mat4 proj;
+// Mesh bounds, used to expand the normalized positions
+uniform vec3 scale;
+uniform vec3 origin;
+
+// Values updated by the demo, uploaded in a single call (see Transforms in demo.py)
+// translation: Camera translation
+// rotation: Model rotation in degrees around the X, Y and Z axis
+layout (std140) uniform Transforms
+{
+	mat4 proj;
+	vec3 translation;
+	vec3 rotation;
+};
 
 
 void main() 
 {
-	gl_Position = proj * view * model * vec4(position.xyz, 1.0);
-}
\ No newline at end of file
+	vec3 r = radians(rotation);
+	vec3 c = cos(r);
+	vec3 s = sin(r);
+
+	mat3 rot_x = mat3(1.0, 0.0, 0.0,   0.0, c.x, s.x,   0.0, -s.x, c.x);
+	mat3 rot_y = mat3(c.y, 0.0, -s.y,   0.0, 1.0, 0.0,   s.y, 0.0, c.y);
+	mat3 rot_z = mat3(c.z, s.z, 0.0,   -s.z, c.z, 0.0,   0.0, 0.0, 1.0);
+
+	vec3 world = rot_x * rot_y * rot_z * (position.xyz * scale + origin);
+	gl_Position = proj * vec4(world + translation, 1.0);
+}
@@ -9,8 +9,9 @@ from os.path import dirname as dn
 sys.path.append(dn(dn(__file__)))
 
 
-import pytest, gc
-from tinyblend import BlenderFile, BlenderObjectFactory, BlenderObject, BlenderFileImportException, BlenderFileReadException
+import pytest, gc, copy
+from weakref import ref
+from tinyblend import BlenderFile, BlenderObjectFactory, BlenderObject, LazyBlenderObject, BlenderFileImportException, BlenderFileReadException
 
 def test_open_blend_file():
     blend = BlenderFile('fixtures/test1.blend')
@@ -81,9 +82,11 @@ def test_equality():
     assert id(world1) is not id(world2)
     assert world1 == world2
 
+    objects = blend.list('Object')
+    assert objects.find_by_name('Suzanne') != objects.find_by_name('Camera')
+
 def test_should_lookup_pointer():
     BlenderObject.CACHE = {}
-    BlenderObjectFactory.CACHE = {}
 
     blend = BlenderFile('fixtures/test1.blend')
 
@@ -113,6 +116,63 @@ def test_should_lookup_pointer_array():
 
     assert data.totvert == len(data.mvert)
 
+    # Pointers are looked up for every object, not once per type
+    assert sorted(type(o.data).__name__ for o in blend.list('Object')) == ['Camera', 'Lamp', 'Mesh']
+
+def test_records():
+    blend = BlenderFile('fixtures/test1.blend')
+
+    mesh = blend.list('Object').find_by_name('Suzanne').data
+    verts = blend.list('MVert').records()
+
+    assert len(verts) == mesh.totvert
+    assert verts[5].co_0_3 == mesh.mvert[5].co[0]
+    assert verts[5].co_2_3 == mesh.mvert[5].co[2]
+    assert len(blend.list('World').records()) == 1
+
+    blend.close()
+
+def test_rows():
+    blend = BlenderFile('fixtures/test1.blend')
+
+    scenes = blend.list('Scene')
+    scene = scenes.find_by_name('MyTestScene')
+    row = [r for r in scenes.rows() if r.id.name == scene.id.name][0]
+
+    assert isinstance(row, LazyBlenderObject)
+    assert row.r.xsch == scene.r.xsch
+    assert row.world == scene.world
+    assert row.materialize() == scene
+    pytest.raises(AttributeError, getattr, row, 'foo')
+    assert copy.copy(row).r.xsch == scene.r.xsch
+
+    blend.close()
+
+def test_buffers():
+    blend = BlenderFile('fixtures/test1.blend')
+
+    verts = blend.list('MVert')
+    fmt = verts.object.FMT.format
+    buffers = verts.buffers()
+
+    assert sum(len(b) for b in buffers) == len(verts.records())*fmt.size
+    assert fmt.unpack_from(buffers[0], 0) == tuple(verts.records()[0])
+
+    del buffers
+    blend.close()
+
+def test_columns():
+    blend = BlenderFile('fixtures/test1.blend')
+
+    mesh = blend.list('Object').find_by_name('Suzanne').data
+    verts = blend.list('MVert').columns()
+
+    assert len(verts['co']) == mesh.totvert*3
+    assert tuple(verts['co'][15:18]) == mesh.mvert[5].co
+    assert tuple(verts['flag']) == tuple(v.flag for v in mesh.mvert)
+
+    blend.close()
+
 def test_blend_struct_lookup():
     blend = BlenderFile('fixtures/test1.blend')
 
@@ -126,11 +186,53 @@ def test_blend_struct_lookup():
     pytest.raises(BlenderFileReadException, blend._struct_lookup, float_index)
     pytest.raises(BlenderFileReadException, blend._struct_lookup, 983742)
 
+    # The names tables behave like tuples
+    assert 5 not in blend.index.type_names
+    assert blend.index.type_names != 5
+    assert blend.index.type_names == tuple(blend.index.type_names)
+    assert blend.index.type_names != list(blend.index.type_names)
+    assert blend.index.type_names != ''.join(blend.index.type_names)
+    pytest.raises(ValueError, blend.index.type_names.index, 5)
+
+    blend.close()
+
+def test_export_struct_different_index(tmpdir):
+    # Same version as test1.blend, but the "totvert" field of Mesh is renamed in the index
+    with open('fixtures/test1.blend', 'rb') as f:
+        data = f.read()
+
+    index_offset = data.find(b'SDNANAME')
+    data = data[:index_offset] + data[index_offset:].replace(b'\x00totvert\x00', b'\x00nverts_\x00')
+    path = str(tmpdir.join('renamed.blend'))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    blend = BlenderFile('fixtures/test1.blend')
+    other = BlenderFile(path)
+    assert blend.header == other.header
+
+    mesh_index = blend.index.type_names.index('Mesh')
+    names = [f.name for f in blend._export_struct(blend._struct_lookup(mesh_index)).fields]
+    other_names = [f.name for f in other._export_struct(other._struct_lookup(mesh_index)).fields]
+    assert 'totvert' in names and 'nverts_' not in names
+    assert 'nverts_' in other_names and 'totvert' not in other_names
+
+    # The types compiled for test1.blend are not used for the renamed file
+    assert 'totvert' in blend.list('Mesh').object.__slots__
+    assert 'nverts_' in other.list('Mesh').object.__slots__
+    assert other.list('Mesh').object is not blend.list('Mesh').object
+
+    other.close()
     blend.close()
 
 def test_weakref():
     blend = BlenderFile('fixtures/test1.blend')
     worlds = blend.list('World')
+
+    # Blender objects can be weakly referenced
+    world = worlds.find_by_name('TestWorld')
+    assert ref(world)() is world
+    del world
     
     del blend
 
@@ -142,25 +244,30 @@ def test_weakref():
 
 def test_cache_lookup():
     blend = BlenderFile('fixtures/test1.blend')
-    v = blend.header.version
 
     worlds = blend.list('World')
 
-    assert BlenderObjectFactory.CACHE[v]['World']() is not None
-    assert BlenderObject.CACHE[v]['World']() is not None
+    assert blend.factories['World'] is worlds
+    world_type = BlenderObject.CACHE[(blend.header, blend.index.dna)]['World']
     
     del worlds
     gc.collect()
 
-    assert BlenderObjectFactory.CACHE[v]['World']() is None
-    assert BlenderObject.CACHE[v]['World']() is None
-
     worlds = blend.list('World')
     assert isinstance(worlds, BlenderObjectFactory)
-    assert BlenderObjectFactory.CACHE[v]['World']() is not None
-    assert BlenderObject.CACHE[v]['World']() is not None
+    assert blend.list('World') is worlds
+    assert worlds.object is world_type
+    assert BlenderObject.CACHE[(blend.header, blend.index.dna)]['World'] is world_type
 
+    # Factories are not shared between files
+    other = BlenderFile('fixtures/test1.blend')
+    assert other.list('World') is not worlds
+    assert other.list('World').file is other
+    assert other.list('World').object is world_type
+
+    other.close()
     blend.close()
+    assert len(blend.factories) == 0
 
 def test_list_structures():
     blend = BlenderFile('fixtures/test1.blend')
@@ -177,3 +284,63 @@ def test_tree():
 def test_open_bad_blend_file():
     pytest.raises(BlenderFileImportException, BlenderFile, 'fixtures/test2.blend')
     pytest.raises(BlenderFileImportException, BlenderFile, 'fixtures/test3.blend')
+
+def test_demo_buffer_pack_malformed():
+    pyglet = pytest.importorskip('pyglet')
+    headless = pyglet.options['headless']
+    path = list(sys.path)
+    pyglet.options['headless'] = True
+    sys.path.append(dn(__file__)+'/demo')
+    try:
+        try:
+            from pyglbuffers import BufferFormat
+        except Exception:
+            pytest.skip('OpenGL is not available')
+
+        fmt = BufferFormat.from_string('(3f)[a](2f)[b]')
+        buffers = fmt.pack([((1,2,3), (4,5))])
+        assert tuple(buffers[0].a) == (1,2,3) and tuple(buffers[0].b) == (4,5)
+
+        # The values of a malformed element are not shifted into the next field
+        pytest.raises(ValueError, fmt.pack, [((1,2,3,4), (5,))])
+    finally:
+        pyglet.options['headless'] = headless
+        sys.path[:] = path
+        sys.modules.pop('pyglbuffers', None)
+
+def test_demo_buffer_mapped_write_error():
+    pyglet = pytest.importorskip('pyglet')
+    headless = pyglet.options['headless']
+    path = list(sys.path)
+    pyglet.options['headless'] = True
+    sys.path.append(dn(__file__)+'/demo')
+    try:
+        try:
+            from pyglbuffers import Buffer, map_info
+            from pyglet.gl import GL_READ_WRITE, GL_ARRAY_BUFFER
+        except Exception:
+            pytest.skip('OpenGL is not available')
+
+        from ctypes import c_ubyte, cast, POINTER
+
+        # A ctypes byte array stands in for the mapped memory, so no GL context is needed
+        buffer = Buffer(0, '(3f)[position](4B)[color]')
+        format = buffer.format
+        memory = (c_ubyte*(format.stride*2))()
+        buffer.mapinfo = map_info(GL_READ_WRITE, GL_ARRAY_BUFFER, cast(memory, POINTER(format.struct)), 2, memory)
+
+        buffer[0] = ((9,9,9), (1,2,3,4))
+        buffer[1] = ((1,2,3), (5,6,7,8))
+        assert tuple(buffer[0]) == ((9,9,9), (1,2,3,4))
+        assert tuple(buffer[1]) == ((1,2,3), (5,6,7,8))
+
+        # An invalid value does not leave a partially written element in the mapped memory
+        pytest.raises(ValueError, buffer.__setitem__, 0, ((1,2,3), (5,6,'x',8)))
+        assert tuple(buffer[0]) == ((9,9,9), (1,2,3,4))
+        assert tuple(buffer[1]) == ((1,2,3), (5,6,7,8))
+
+        buffer.mapinfo = None
+    finally:
+        pyglet.options['headless'] = headless
+        sys.path[:] = path
+        sys.modules.pop('pyglbuffers', None)
@@ -47,13 +47,44 @@ SOFTWARE.
 
 from struct import Struct
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, Counter
 from weakref import ref
-import re
+from mmap import mmap, ACCESS_READ
+from array import array
+from itertools import chain
+from functools import lru_cache
+from keyword import iskeyword
+from sys import intern
+import os, re
+
+# Translation table of the ascii digits to their values. Used to read the version in the file header
+_ASCII_DIGITS = bytes((b-48) & 0xFF for b in range(256))
+
+# Layout of the blend file header: magic, pointer size char, endianess char and version digits
+_HEADER = Struct('7scc3s')
+
+# Tokens (count, format char) of a Struct format string
+_FMT_TOKENS = re.compile(r'(\d*)([a-zA-Z])')
 
 # List of base types found in blend fields and their struct char representation.
 _BASE_TYPES = {'float':'f', 'double':'d', 'int':'i', 'short':'h', 'ushort': "H", 'char':'c', 'char': 'B', 'long': 'l', 'ulong': 'L', 'uint64_t':'Q', 'int64_t':'q'}
 
+@lru_cache(maxsize=None)
+def _make_struct(fmt):
+    """
+        Return a compiled Struct for fmt. The same small formats are used by every file that is opened
+        and the formats of the blender types are shared by the files of the same version, so the compiled
+        objects are kept around.
+    """
+    return Struct(fmt)
+
+def _struct_format(fmt):
+    """
+        Return the format string of the Struct fmt as a str. Struct.format is a bytes object before Python 3.7
+    """
+    fmt = fmt.format
+    return fmt.decode() if isinstance(fmt, bytes) else fmt
+
 class BlenderFileException(Exception):
     """
         Base exception class for blender import related exceptions
@@ -88,10 +119,11 @@ class NamedStruct(object):
         A type that fuse namedtuple and Struct together.
     """
 
-    __fields__ = ('names', 'format')
+    __slots__ = ('names', 'format', '_make', '_unpack', '_unpack_from', '_iter_unpack')
     def __init__(self, name, fmt, *fields):
-        self.format = Struct(fmt)
+        self.format = _make_struct(fmt)
         self.names = namedtuple(name, fields)
+        self._bind()
 
     @classmethod
     def from_namedtuple(cls, ntuple, fmt):
@@ -101,51 +133,134 @@ class NamedStruct(object):
             Author: Gabriel Dube
         """
         named_struct = super(NamedStruct, cls).__new__(cls)
-        named_struct.format = Struct(fmt)
+        named_struct.format = _make_struct(fmt)
         named_struct.names = ntuple
+        named_struct._bind()
 
         return named_struct
 
-    def unpack(self, data):
-        x, y = len(data), self.format.size
-        if (x > y) and (x % y == 0):
-            return tuple(self.iter_unpack(data))
+    def _bind(self):
+        # The methods of the struct and the namedtuple are bound once, the unpack functions are called for every record
+        self._make = self.names._make
+        self._unpack = self.format.unpack
+        self._unpack_from = self.format.unpack_from
+        self._iter_unpack = self.format.iter_unpack
 
-        return self.names(*self.format.unpack(data))
+    def unpack(self, data):
+        return self._make(self._unpack(data))
 
     def unpack_from(self, data, offset):
-        return self.names(*self.format.unpack_from(data, offset))
+        return self._make(self._unpack_from(data, offset))
 
     def iter_unpack(self, data):
-        return (self.names(*d) for d in self.format.iter_unpack(data))
+        return map(self._make, self._iter_unpack(data))
+
+class NameTable(object):
+    """
+        Read only sequence of the names found in a blend file index. The names are kept
+        as they are stored in the file and are only decoded when they are accessed.
+        A table compares equal to a table or a tuple of the same names, but unlike a tuple it is not hashable.
+    """
+    __slots__ = ('raw', 'names', 'positions')
+
+    __hash__ = None
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.names = [None]*len(raw)
+        self.positions = None
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return tuple([self[i] for i in range(*index.indices(len(self.raw)))])
+
+        # The names are interned, they are used as attribute names of the blender objects
+        name = self.names[index]
+        if name is None:
+            name = self.names[index] = intern(self.raw[index].decode('utf-8'))
+
+        return name
+
+    def __iter__(self):
+        for index in range(len(self.raw)):
+            yield self[index]
+
+    def __contains__(self, name):
+        try:
+            self.index(name)
+            return True
+        except ValueError:
+            return False
+
+    def __eq__(self, other):
+        if not isinstance(other, (NameTable, tuple)):
+            return NotImplemented
+
+        return tuple(self) == tuple(other)
+
+    def index(self, name):
+        """
+            Return the index of the first occurence of "name" in the table. Raise a ValueError if name is not found.
+            The positions of the names are computed on the first call.
+        """
+        positions = self.positions
+        if positions is None:
+            positions = self.positions = {}
+            for index, raw_name in enumerate(self.raw):
+                positions.setdefault(raw_name, index)
+
+        index = positions.get(name.encode('utf-8')) if type(name) is str else None
+        if index is None:
+            raise ValueError('{} is not in the table'.format(repr(name)))
+
+        return index
 
 class AddressLookup(object):
     """
         Descriptor that wraps get/set actions on pointer fields.
+        The pointers are looked up when they are first accessed, the result is then kept in the object.
     """
-    __slots__ = ['name', 'value']
+    __slots__ = ['name', 'cache_name']
 
     def __init__(self, name):
         # ptr is the suffix given to all pointer fields in compile_fmt
         self.name = 'ptr_'+name
-        self.value = None
+        self.cache_name = '_ptr_'+name
 
     def __set__(self, instance, value):
         raise AttributeError('Attribute cannot be setted')
 
     def __get__(self, instance, cls):
-        if self.value is None:
-            ptr = getattr(instance, self.name)
-            if type(ptr) is int and ptr != 0:
-                self.value = instance.file._from_address(ptr)
-            elif type(ptr) is tuple:
-                self.value = instance.file._from_addresses(ptr)
+        if instance is None:
+            return self
 
-        return self.value
+        try:
+            return getattr(instance, self.cache_name)
+        except AttributeError:
+            value = self.lookup(instance)
+            setattr(instance, self.cache_name, value)
+            return value
 
     def __delete__(self, instance):
         raise AttributeError('Attribute cannot be deleted')
 
+    def lookup(self, instance):
+        """
+            Return the object(s) at the address of the pointer field of instance. Null pointers return None.
+        """
+        ptr = getattr(instance, self.name)
+
+        # The file property can be shadowed by a field named "file" (ex: FileSelectParams)
+        if type(ptr) is int and ptr != 0:
+            return BlenderObject.file.fget(instance)._from_address(ptr)
+        elif type(ptr) is tuple:
+            return BlenderObject.file.fget(instance)._from_addresses(ptr)
+
+        return None
+
 class BlenderObject(object):
     """
         Blender object base. Unpack raw data depending on the subclass format string.
@@ -161,9 +276,16 @@ class BlenderObject(object):
             This class keeps a weakref to to its parent blend file. If the parent file
             is closed or freed, the pointer lookup will raise a RuntimeError
 
+        Instances do not have a __dict__, subclasses define the slots of their fields.
+        Instances can still be weakly referenced.
+
         author: Gabriel Dube
     """
-    # Cache for BlenderObject subclasses. Dict of {VERSION: {CLASS_NAME: CLASS}}
+    __slots__ = ('_file', '__weakref__')
+
+    # Cache for BlenderObject subclasses. Dict of {(HEADER, RAW_INDEX): {CLASS_NAME: CLASS}}, see BlenderFile.BlendFileInfo
+    # and BlenderFile.BlendIndex. The types are kept for the lifetime of the process, there is only one type per
+    # structure and per index.
     CACHE = {}
     
     # Version of the blend file. Overriden in subclasses.
@@ -172,45 +294,21 @@ class BlenderObject(object):
     # Format Struct to unpack the raw data. Overriden in subclasses
     FMT = None
 
-    # List of (subclasses, offset) in the object. Overriden is subclasses 
+    # List of (subclasses, offset, name) in the object. Overriden is subclasses 
     CLASSES = None
 
-    @staticmethod
-    def _set_fields(names, data, obj):
-        """
-            Unpack the base types (float, int, etc) from the raw data to the object
+    # List of (name, index) of the base types fields in the values unpacked by FMT. Index is a slice
+    # for the arrays, which are set as tuples. Overriden in subclasses
+    FIELD_LAYOUT = None
 
-            author: Gabriel Dube
-        """
-        template = re.compile('(.+)_\d+_(\d+)')
-        gen = zip(names, data)
-        while True:
-            name, value = gen.__next__()
-            match = template.findall(name)
-            if len(match) == 0:
-                setattr(obj, name, value)
-            else:
-                field_name, array_len = match[0]
-                arr = [value]
-                for i in range(int(array_len)-1):
-                    _, value = gen.__next__()
-                    arr.append(value)
-                setattr(obj, field_name, tuple(arr))
+    # Function that sets the fields of an object from the raw data, generated from FMT, CLASSES and FIELD_LAYOUT.
+    # Signature: UNPACK(obj, file, data, offset). Overriden in subclasses, see BlenderObjectFactory.compile_unpack
+    UNPACK = None
 
-
-    def __new__(cls, file, data):
+    def __new__(cls, file, data, offset=0):
         obj = super(BlenderObject, cls).__new__(cls)
         obj._file = file
-
-        # Unpack structures from the raw data to the object
-        for cls_, slice, name in cls.CLASSES:
-            obj_ = cls_(file, data[slice])
-            setattr(obj, name, obj_)
-
-        try:
-            BlenderObject._set_fields(cls.FMT.names._fields, cls.FMT.unpack(data), obj)
-        except StopIteration:
-            pass
+        cls.UNPACK(obj, file, data, offset)
 
         return obj
 
@@ -218,21 +316,16 @@ class BlenderObject(object):
         if type(other) is not type(self):
             return False
 
-        eq = False
-        template = re.compile('(.+)_\d+_(\d+)')
-        name_iter = iter(self.FMT.names._fields)
-        for name in name_iter:
-            match = template.findall(name)
-            if len(match) == 0:
-                eq |= getattr(self, name) == getattr(other, name)
-            else:
-                field_name, array_len = match[0]
-                eq |= getattr(self, field_name) == getattr(other, field_name)
+        # The fields are compared as they are set on the objects, arrays as tuples and pointers by address
+        for name, index in self.FIELD_LAYOUT:
+            if getattr(self, name) != getattr(other, name):
+                return False
 
-                # Skip the following names in the array
-                [next(name_iter) for i in range(int(array_len)-1)]
+        for cls, offset, name in self.CLASSES:
+            if getattr(self, name) != getattr(other, name):
+                return False
 
-        return eq
+        return True
 
     @property
     def file(self):
@@ -245,11 +338,109 @@ class BlenderObject(object):
     def tree(self, recursive=True, max_level=999):
         return self.file.tree(type(self).__name__, recursive, max_level)
 
+class LazyBlenderObject(object):
+    """
+        Read only view over the data of a blender object. The fields are unpacked from the raw data
+        when they are accessed, so reading a few fields of many objects does not build the whole objects.
+        Child structures are returned as LazyBlenderObject and pointers are looked up like in BlenderObject.
+        Use materialize to build the BlenderObject.
+    """
+    __slots__ = ('_cls', '_data', '_offset', '_file', '_cache')
+
+    # Cache of the fields readers. Dict of {BLENDER_OBJECT_TYPE: {FIELD_NAME: (Struct, OFFSET, IS_ARRAY)}}
+    FIELDS = {}
+
+    @staticmethod
+    def _fields(cls):
+        """
+            Compute the offset and the Struct of every base type field of a blender object type
+        """
+        fields = LazyBlenderObject.FIELDS.get(cls)
+        if fields is not None:
+            return fields
+
+        fmt = _struct_format(cls.FMT.format)
+        endian = fmt[0]
+
+        # Offset and format char of every unpacked value
+        values, offset = [], 0
+        for count, char in _FMT_TOKENS.findall(fmt[1::]):
+            count = int(count or 1)
+            if char == 'x':
+                offset += count
+            elif char == 's':
+                values.append((offset, str(count)+char))
+                offset += count
+            else:
+                size = _make_struct(endian+char).size
+                values.extend((offset+i*size, char) for i in range(count))
+                offset += count*size
+
+        fields = {}
+        for name, index in cls.FIELD_LAYOUT:
+            if type(index) is slice:
+                value_offset, char = values[index.start]
+                fields[name] = (_make_struct(endian+str(index.stop-index.start)+char), value_offset, True)
+            else:
+                value_offset, char = values[index]
+                fields[name] = (_make_struct(endian+char), value_offset, False)
+
+        LazyBlenderObject.FIELDS[cls] = fields
+        return fields
+
+    def __init__(self, cls, file, data, offset=0):
+        self._cls = cls
+        self._file = file
+        self._data = data
+        self._offset = offset
+        self._cache = {}
+
+    def __getattr__(self, name):
+        # Unset slots (ex: while the object is copied) must not be looked up as fields
+        if name in LazyBlenderObject.__slots__:
+            raise AttributeError(name)
+
+        cache = self._cache
+        if name in cache:
+            return cache[name]
+
+        cls = self._cls
+        field = LazyBlenderObject._fields(cls).get(name)
+        if field is not None:
+            fmt, offset, is_array = field
+            value = fmt.unpack_from(self._data, self._offset+offset)
+            value = value if is_array else value[0]
+        else:
+            for cls_, cls_offset, cls_name in cls.CLASSES:
+                if cls_name == name:
+                    value = LazyBlenderObject(cls_, self._file, self._data, self._offset+cls_offset)
+                    break
+            else:
+                lookup = cls.__dict__.get(name)
+                if type(lookup) is not AddressLookup:
+                    raise AttributeError("'{}' object has no attribute '{}'".format(cls.__name__, name))
+
+                # Pointers are resolved by the descriptor of the type, like in BlenderObject
+                value = lookup.lookup(self)
+
+        cache[name] = value
+        return value
+
+    def __repr__(self):
+        return "<Lazy '{}' object>".format(self._cls.__name__)
+
+    def materialize(self):
+        """
+            Build the BlenderObject of this view
+        """
+        return self._cls(self._file, self._data, self._offset)
+
 class BlenderObjectFactory(object):
     """
         Object that reads blender structures from datablocks. A BlenderObjectFactory
         is created when the data types is accessed for the first time in a blend file.
-        The BlenderObjectFactory is then cached because their creation can be quite expensive.
+        The BlenderObjectFactory is then cached in its parent file (see BlenderFile.factories) because their
+        creation can be quite expensive.
 
         A BlenderObjectFactory keeps a weakref to its parent blend file. If the parent file
         is closed or freed, all its methods will raise a RuntimeError
@@ -260,20 +451,21 @@ class BlenderObjectFactory(object):
 
         author: Gabriel Dube
     """
-    # Cache for instanced factories. Dict of {VERSION: {CLASS_NAME: CLASS}}
-    CACHE = {}
-
     @staticmethod
-    def compile_fmt(fields):
+    def compile_fmt(fields, ptr_char='P', endian_char=''):
         """
             Compile a list of BlenderFile.BlendStructField into a format string that can be passed
-            to a Struct objet
+            to a Struct objet. Also return the names of the unpacked values and the layout of the
+            fields in those values (see BlenderObject.FIELD_LAYOUT).
+            The pointers are written with ptr_char and the format starts with endian_char, pass the values
+            of the blend file arch and endianess to get the final format.
 
             Author: Gabriel Dube
         """
         base_types = _BASE_TYPES
-        fmt = ''
+        fmt = [endian_char]
         fmt_names = []
+        layout = []
 
         # names cannot start with an underscore
         def fix_name(n):
@@ -287,33 +479,71 @@ class BlenderObjectFactory(object):
         
             if f.count > 1 and t != 'char':
                 # A unique name must be generated for every item in an array that is not composed of chars
-                # This is translated to a python list when the blender types is instanciated
-                name = (fix_name(f.name+('_{}_{}'.format(i, count))) for i in range(f.count))
+                # This is translated to a python tuple when the blender types is instanciated
+                name = [fix_name(f.name+('_{}_{}'.format(i, count))) for i in range(f.count)]
+                field_name = fix_name(f.name)
             else:
-                name = (fix_name(f.name),)
+                name = [fix_name(f.name)]
+                field_name = None
 
-            # If type is a pointer
+            # Pointer fields are read by AddressLookup
             if f.ptr:
-                fmt_names.extend(('ptr_'+n for n in name))
-                fmt += count+'P'
+                name = ['ptr_'+n for n in name]
+                field_name = field_name and 'ptr_'+field_name
+            
+            # Other structures are unpacked by their own types
+            if not f.ptr and not f.is_base:
+                fmt.append(str(f.size)+'x')
                 continue
-
-            # If type is a base type
-            if t in base_types:
+            
+            # Scalars are named when the type is built, see _build_objects
+            start = len(fmt_names)
+            if field_name is None:
+                layout.append((None, start))
+            else:
+                layout.append((field_name, slice(start, start+f.count)))
+            fmt_names.extend(name)
+            
+            if f.ptr:
+                fmt.append(count+ptr_char)
+            elif t == 'char' and f.count > 1:
                 # Strings
-                if t == 'char' and f.count > 1:
-                    t = count+'s'
-                else:
-                    t = count+base_types[t]
-                fmt_names.extend(name)
-                fmt += t
-                continue
+                fmt.append(count+'s')
+            else:
+                fmt.append(count+base_types[t])
 
-            # If type is another structure
-            fmt += (str(f.size)+'x')
-        
+        return ''.join(fmt), fmt_names, layout
 
-        return fmt, fmt_names
+    @staticmethod
+    def compile_unpack(fmt, layout, dependencies):
+        """
+            Generate the function that unpacks the raw data of a blender object type to an object
+            (see BlenderObject.UNPACK). The child structures are read at their offset in the data, so
+            the data is never copied. Then the base types (float, int, etc) are set from the values
+            unpacked by fmt. Assigning the fields one by one is faster than looping over the layout.
+        """
+        def assign(name, value):
+            # Field names that are not valid attribute names in python code are set with setattr
+            if name.isidentifier() and not iskeyword(name):
+                return '    obj.{} = {}'.format(name, value)
+            else:
+                return '    setattr(obj, {}, {})'.format(repr(name), value)
+
+        namespace = {'unpack_from': fmt.format.unpack_from}
+        source = ['def unpack(obj, file, data, offset):']
+        for i, (cls, cls_offset, name) in enumerate(dependencies):
+            namespace['C{}'.format(i)] = cls
+            source.append(assign(name, 'C{}(file, data, offset+{})'.format(i, cls_offset)))
+
+        source.append('    v = unpack_from(data, offset)')
+        for name, index in layout:
+            if type(index) is slice:
+                source.append(assign(name, 'v[{}:{}]'.format(index.start, index.stop)))
+            else:
+                source.append(assign(name, 'v[{}]'.format(index)))
+
+        exec('\n'.join(source), namespace)
+        return namespace['unpack']
 
     @staticmethod
     def _build_objects(file, struct):
@@ -322,22 +552,23 @@ class BlenderObjectFactory(object):
 
             author: Gabriel Dube
         """
-        base_types = _BASE_TYPES
         head = file.header
         arch, endian = head[1::]
         
-        # Get cache
+        # Get cache. The formats of the types depend on the pointer size and the endianess of the file,
+        # and their fields on the index of the file, so the types are cached by header and by raw index
         version = file.header.version
-        version_cache = BlenderObject.CACHE.get(version)
+        key = (head, file.index.dna)
+        version_cache = BlenderObject.CACHE.get(key)
         if version_cache is None:
             version_cache = {}
-            BlenderObject.CACHE[version] = version_cache
+            BlenderObject.CACHE[key] = version_cache
         
         # Get the name of the struct
         name = file.index.type_names[struct.index]
 
         # If type was cached, use the cached version
-        obj = (version_cache.get(name) or (lambda: None) )()
+        obj = version_cache.get(name)
         if obj is not None:
             return obj, obj.CLASSES
 
@@ -349,41 +580,47 @@ class BlenderObjectFactory(object):
         name, fields = file._export_struct(struct)
         
         # 2. Extract other blender objects types contained in this object (pointer fields types are ignored)
-        #    The dependency contains the type, a slice to extract the child data from the parent data and the name to be used in the parent object
+        #    The dependency contains the type, the offset of the child data in the parent data and the name to be used in the parent object
         for f, dna in zip(fields, struct.fields):
-            if f.type not in base_types and not f.ptr:
+            if not f.is_base and not f.ptr:
                 tmp_dna = file._struct_lookup(dna.index_type)
-                dep = (BlenderObjectFactory._build_objects(file, tmp_dna)[0], slice(offset, offset+f.size), f.name)
+                dep = (BlenderObjectFactory._build_objects(file, tmp_dna)[0], offset, f.name)
                 dependencies.append(dep)
 
             offset += f.size
         
         # 3. Compile a format string from the extracted fields and build a namedstruct to extract the raw data. See the BlenderObject constructor.
-        fmt, fmt_names = BlenderObjectFactory.compile_fmt(fields)
+        fmt, fmt_names, layout = BlenderObjectFactory.compile_fmt(fields, arch.value, endian.value)
         fmt_names = namedtuple(name, fmt_names, rename=True)
-        fmt = (endian.value)+fmt.replace('P', arch.value)
         fmt = NamedStruct.from_namedtuple(fmt_names, fmt)
+
+        # Scalar fields are set under their namedtuple name, in case it was renamed (ex: python keywords)
+        layout = tuple((field_name or fmt_names._fields[index], index) for field_name, index in layout)
         
         # 4. Then build the type itself
-        class_attrs = {'VERSION':version, 'FMT': fmt, 'CLASSES': dependencies}
+        class_attrs = {'VERSION':version, 'FMT': fmt, 'CLASSES': dependencies, 'FIELD_LAYOUT': layout}
+        class_attrs['UNPACK'] = staticmethod(BlenderObjectFactory.compile_unpack(fmt, layout, dependencies))
+
+        # One slot per field set on the objects. See BlenderObject.__new__
+        slots = [field_name for field_name, index in layout] + [dep_name for _, _, dep_name in dependencies]
 
-        # Add pointer lookup descriptor to the type attributes
+        # Add pointer lookup descriptor to the type attributes, and a slot for the looked up values
         for f in (f for f in fields if f.ptr): 
-            class_attrs[f.name] = AddressLookup(f.name)
+            lookup = class_attrs[f.name] = AddressLookup(f.name)
+            slots.append(lookup.cache_name)
+
+        class_attrs['__slots__'] = tuple(dict.fromkeys(slots))
 
         obj = type(name, (BlenderObject,), class_attrs)
-        version_cache[name] = ref(obj)
+        version_cache[name] = obj
 
         return obj, tuple(dependencies)
 
     def __init__(self, file, type_name_index):
         self._file = ref(file)
 
-        for index, struct_dna in enumerate(file.index.structures):
-            if struct_dna.index == type_name_index:
-                self.struct_dna = struct_dna
-                self.sdna_index = index
-                break
+        self.struct_dna = file._struct_lookup(type_name_index)
+        self.sdna_index = file.index.structures_by_type[type_name_index]
 
         dnafields = self.struct_dna.fields
         dnatypes = file.index.type_names
@@ -393,16 +630,12 @@ class BlenderObjectFactory(object):
 
         self.object, _ = BlenderObjectFactory._build_objects(file, self.struct_dna)
         self.object_name = file.index.type_names[self.struct_dna.index]
+
+        # Blocks of the objects by name. See find_by_name
+        self._name_index = None
         
     def __len__(self):
-        file = self.file
-        blocks = file.blocks
-        count = 0
-
-        for block, offset in blocks:
-            count += block.sdna == self.sdna_index
-
-        return count
+        return self.file.sdna_counts[self.sdna_index]
 
     def __repr__(self):
         file = self.file
@@ -412,12 +645,10 @@ class BlenderObjectFactory(object):
 
     def __iter__(self):
         file = self.file
-        blocks = file.blocks
+        obj, file_ref, read_block = self.object, self._file, file._read_block
 
-        for block, offset in blocks:
-            if block.sdna == self.sdna_index:
-                data = file._read_block(block, offset)
-                yield self.object(self._file, data)
+        for block, offset in file.blocks_by_sdna.get(self.sdna_index, ()):
+            yield obj(file_ref, read_block(block, offset))
     
     @property
     def file(self):
@@ -427,6 +658,88 @@ class BlenderObjectFactory(object):
         
         return file
 
+    def rows(self):
+        """
+            Iterate over the objects of this type without building them. Yield a LazyBlenderObject
+            for every object read by the iteration. This is faster than iterating over the factory when
+            only a few fields of every object are read.
+            The lazy objects reference the memory map of the file. The map is not closed by
+            BlenderFile.close while one of them is alive, it is closed when the last one is freed.
+        """
+        file = self.file
+
+        for block, offset in file.blocks_by_sdna.get(self.sdna_index, ()):
+            data = file._read_block(block, offset)
+            yield LazyBlenderObject(self.object, self._file, data)
+
+    def records(self):
+        """
+            Return the raw values of every object of this type in the blend file as a list of
+            namedtuple (see BlenderObject.FMT). This is a lot faster than iterating over the factory
+            when many objects must be read, because no BlenderObject is created: arrays are not grouped,
+            pointers are not resolved and the fields of the child structures are not included.
+            Unlike the iteration, all the objects of the blocks holding more than one object are returned.
+        """
+        fmt = self.object.FMT
+        make, iter_unpack = fmt.names._make, fmt.format.iter_unpack
+
+        records = []
+        for data in self.buffers():
+            records.extend(map(make, iter_unpack(data)))
+
+        return records
+
+    def buffers(self):
+        """
+            Return the raw data of the objects of this type, one memoryview of the memory map per block.
+            Nothing is copied. The objects of a block follow each other and are laid out as described by
+            the format of BlenderObject.FMT, so a view can be handed as is to a library that reads packed
+            records (ex: numpy.frombuffer). See records for the objects that are included.
+            The memory map is not closed by BlenderFile.close while a view is alive, the views must be
+            released (ex: del) to close it with the file.
+        """
+        file = self.file
+        size = self.object.FMT.format.size
+
+        buffers = []
+        for block, offset in file.blocks_by_sdna.get(self.sdna_index, ()):
+            # Some blocks (ex: Link) are smaller than their objects count
+            data = file._read_block(block, offset)
+            count = min(block.count, len(data)//size)
+            buffers.append(data[0:count*size])
+
+        return buffers
+
+    def columns(self):
+        """
+            Return the base types fields of every object of this type in the blend file, one column per field.
+            Return a dict of {field name: values}. The numeric values are stored in an array.array;
+            the values of array fields follow each other (ex: the "co" column of MVert holds x, y, z of the
+            first vertex, then x, y, z of the second vertex, ...). Strings are returned in a list.
+            See records for the objects that are read.
+        """
+        fmt = self.object.FMT
+        columns = list(zip(*self.records())) or [()]*len(fmt.names._fields)
+
+        # Format char of every unpacked value
+        chars = []
+        for count, char in _FMT_TOKENS.findall(_struct_format(fmt.format)):
+            if char == 's':
+                chars.append(char)
+            elif char != 'x':
+                chars.extend(char*int(count or 1))
+
+        fields = {}
+        for name, index in self.object.FIELD_LAYOUT:
+            if type(index) is slice:
+                char, values = chars[index.start], chain.from_iterable(zip(*columns[index]))
+            else:
+                char, values = chars[index], columns[index]
+
+            fields[name] = list(values) if char == 's' else array(char, values)
+
+        return fields
+
     def find_by_name(self, name):
         """
             Find and build an object by name. If the object does not have a name,
@@ -437,13 +750,34 @@ class BlenderObjectFactory(object):
         if not self.has_name:
             raise BlenderFileReadException('Object type do not have a name')
 
-        name_bytes = name.encode()
-        for obj in self:
-            _name = obj.id.name
-            if _name[2:_name.index(0)] == name_bytes:
-                return obj
+        file = self.file
+        if self._name_index is None:
+            self._name_index = self._index_names(file)
+
+        block = self._name_index.get(name.encode())
+        if block is None:
+            raise KeyError('File do not have {} objects named \'{}\''.format(self.object_name, name))
+
+        return self.object(self._file, file._read_block(*block))
+
+    def _index_names(self, file):
+        """
+            Return the blocks of the objects by name, as {name: (block, offset)}. Only the ID structure
+            of the objects is unpacked. The two letters code at the start of the names is not included.
+        """
+        id_field = next(((cls_, offset) for cls_, offset, name in self.object.CLASSES if name == 'id'), None)
+        if id_field is None:
+            raise BlenderFileReadException('Object type do not have a name')
+
+        id_type, id_offset = id_field
+        unpack_from, name_index = id_type.FMT.format.unpack_from, dict(id_type.FIELD_LAYOUT)['name']
+
+        names = {}
+        for block, offset in file.blocks_by_sdna.get(self.sdna_index, ()):
+            name = unpack_from(file.data, offset+id_offset)[name_index]
+            names.setdefault(name[2:].split(b'\0', 1)[0], (block, offset))
 
-        raise KeyError('File do not have {} objects named \'{}\''.format(self.object_name, name))
+        return names
 
 
 class BlenderFile(object):
@@ -452,9 +786,14 @@ class BlenderFile(object):
 
         Attributes:
             * handle - Underlying file object
+            * data   - Read only memory map of the file
             * header - Information about the whole file. version (major,minor,rev), arch (32/64bits) and endianess (little/big)
             * blocks - List of blender data block in the blend file
             * index  - List if all name, types and structures contained in the blend file
+            * sdna_counts - Number of blocks of each structure, as {sdna index: blocks count}
+            * blocks_by_sdna - Blocks of each structure, as {sdna index: [(block, offset), ...]}
+            * blocks_by_address - Blocks by their old memory address, as {address: (block, offset)}. Used by the pointer lookups
+            * factories - Factories returned by list, as {type name: BlenderObjectFactory}
     
         author: Gabriel Dube
     """
@@ -462,6 +801,10 @@ class BlenderFile(object):
     Arch   = Enum('Arch', (('X32', 'I'), ('X64', 'Q')), qualname='BlenderFile.Arch')
     Endian = Enum('Endian', (('Little', '<'), ('Big', '>')), qualname='BlenderFile.Endian')
 
+    # Header chars of the architectures and endianess. See _parse_header
+    ARCH_CHARS   = {b'-': Arch.X64, b'_': Arch.X32}
+    ENDIAN_CHARS = {b'v': Endian.Little, b'V': Endian.Big}
+
     # Version structures
     VersionInfo   = namedtuple('VersionInfo', ('major', 'minor', 'rev'))
     BlendFileInfo = namedtuple('BlendFileInfo', ('version', 'arch', 'endian'))
@@ -470,9 +813,15 @@ class BlenderFile(object):
     BlendBlockHeader     = namedtuple('BlendBlockHeader', ('code', 'size', 'addr', 'sdna', 'count'))
     BlendStructFieldDNA  = namedtuple('BlendStructFieldDNA', ('index_type', 'index_name'))
     BlendStructDNA       = namedtuple('BlendStructDNA', ('index', 'fields'))
-    BlendStructField     = namedtuple('BlendStructField', ('name', 'type', 'size', 'ptr', 'count'))
+    BlendStructField     = namedtuple('BlendStructField', ('name', 'type', 'size', 'ptr', 'count', 'is_base'))
     BlendStruct          = namedtuple('BlendStruct', ('name', 'fields'))
-    BlendIndex           = namedtuple('BlendIndex', ('field_names', 'type_names', 'type_sizes', 'structures'))
+    BlendIndex           = namedtuple('BlendIndex', ('field_names', 'type_names', 'type_sizes', 'structures', 'structures_by_type', 'dna'))
+
+    # Cache for parsed indexes. Dict of {(ENDIAN, ARCH, RAW_INDEX): BlendIndex}. See _parse_index
+    INDEX_CACHE = {}
+
+    # Cache for exported structures. Dict of {(ARCH, RAW_INDEX, STRUCT_INDEX): BlendStruct}. See _export_struct
+    EXPORT_CACHE = {}
 
     @staticmethod
     def _parse_header(header):
@@ -487,28 +836,16 @@ class BlenderFile(object):
 
             author: Gabriel Dube
         """
-        if len(header) != 12 or header[0:7] != b'BLENDER':
-            return None
-       
-        arch = header[7:8]
-        endian = header[8:9]
-        version = [x-48 for x in header[9::]]
-
-        if arch == b'-':
-            arch = BlenderFile.Arch.X64
-        elif arch == b'_':
-            arch = BlenderFile.Arch.X32
-        else:
+        if len(header) != 12:
             return None
 
-        if endian == b'v':
-            endian = BlenderFile.Endian.Little
-        elif endian == b'V':
-            endian = BlenderFile.Endian.Big
-        else:
+        magic, arch, endian, version = _HEADER.unpack(header)
+        arch = BlenderFile.ARCH_CHARS.get(arch)
+        endian = BlenderFile.ENDIAN_CHARS.get(endian)
+        if magic != b'BLENDER' or arch is None or endian is None or not version.isdigit():
             return None
 
-        version = BlenderFile.VersionInfo(*version)
+        version = BlenderFile.VersionInfo._make(version.translate(_ASCII_DIGITS))
 
         return BlenderFile.BlendFileInfo(version=version, arch=arch, endian=endian)
 
@@ -519,12 +856,9 @@ class BlenderFile(object):
 
             author: Gabriel Dube
         """
-        
-        lookup = (s for s in self.index.structures if s.index == index)
-        try:
-            return next(lookup)
-        except StopIteration:
-            if index > len(self.index.type_names) or index < 0:
+        position = self.index.structures_by_type.get(index)
+        if position is None:
+            if index >= len(self.index.type_names) or index < 0:
                 msg = 'Type index {} is not valid for this blend file'.format(index)
             else:
                 type_name = self.index.type_names[index]
@@ -532,17 +866,26 @@ class BlenderFile(object):
 
             raise BlenderFileReadException(msg)
 
+        return self.index.structures[position]
+
     def _export_struct(self, struct):
         """
             Format a blender struct object fields in a human readable dict.
             This is used when creating blender object types
 
-            If recursive is set to True, the function will also export the composed types of struct
+            The exported structures are cached, because they are shared by every file with the same index.
+            The type indexes are only valid in the index they come from, so the raw index is part of the key.
 
             author: Gabriel Dube
         """        
+        key = (self.header.arch, self.index.dna, struct.index)
+        exported = BlenderFile.EXPORT_CACHE.get(key)
+        if exported is not None:
+            return exported
+
         BlendStruct = BlenderFile.BlendStruct
         BlendStructField = BlenderFile.BlendStructField
+        base_types = _BASE_TYPES
 
         field_names = self.index.field_names
         type_names = self.index.type_names
@@ -553,32 +896,30 @@ class BlenderFile(object):
         struct_name = type_names[struct.index]
         struct_fields = []
 
-        array_template = re.compile('\[(\d+)\]')
-
         for ftype, fname in struct.fields:
             name = field_names[fname]
             _type = type_names[ftype]
             size = type_sizes[ftype]
 
-            is_ptr = name[0] == '*'
-            is_array = name[-1] == ']'
-
+            is_ptr = name.startswith('*')
             if is_ptr:
                 name = name.lstrip('*')
                 size = ptr_size
 
+            # Array names are in the form "name[x]" or "name[x][y]", the count is the product of the dimensions
+            name, is_array, dimensions = name.partition('[')
+            count = 1
             if is_array:
-                count = 1
-                for v in array_template.findall(name):
+                for v in dimensions[:-1].split(']['):
                     count *= int(v)
-                name = name[0:name.index('[')]
                 size *= count
-            else:
-                count = 1
 
-            struct_fields.append(BlendStructField(name=name, type=_type, size=size, ptr=is_ptr, count=count))
+            struct_fields.append(BlendStructField(name=name, type=_type, size=size, ptr=is_ptr, count=count, is_base=_type in base_types))
 
-        return BlendStruct(name=struct_name, fields=tuple(struct_fields))
+        exported = BlendStruct(name=struct_name, fields=tuple(struct_fields))
+        BlenderFile.EXPORT_CACHE[key] = exported
+
+        return exported
 
     def _fmt_strct(self, fmt):
         """
@@ -588,80 +929,100 @@ class BlenderFile(object):
         head = self.header
         return head.endian.value + (fmt.replace('P', head.arch.value))
 
-    def _parse_index(self, head):
+    @staticmethod
+    def _read_names(data, offset, count):
+        """
+            Read "count" null terminated names in data, starting at offset. Return the names and
+            the offset following the last name. The names are split in a single pass, the end offset
+            is computed from the size of the data that was not split.
+        """
+        names = bytes(data[offset:]).split(b'\x00', count)
+        if len(names) <= count:
+            raise BlenderFileImportException('Malformed index')
+
+        rest = names.pop()
+        return names, len(data)-len(rest)
+
+    def _parse_index(self, head, offset):
         """
-            Parse the blender index and return the parsed data.
+            Parse the blender index and return the parsed data. "offset" is the position of the index data in the file.
             The index has an unkown length, so it cannot be parsed in one shot
 
             Author: Gabriel Dube
         """
-        def align():
-            nonlocal offset
-            tmp = offset%4
-            offset += 0 if tmp==0 else 4-tmp
-
-
-        Int = NamedStruct('Int', self._fmt_strct('i'), 'val')
-        Short = NamedStruct('Short', self._fmt_strct('h'), 'val')
+        # The counts are read with the cached Structs, no namedtuple type is created when a file is opened
+        read_int = _make_struct(self._fmt_strct('i')).unpack_from
         BlendStructFieldDNA = NamedStruct.from_namedtuple(BlenderFile.BlendStructFieldDNA, self._fmt_strct('hh'))
         BlendStructDNA = BlenderFile.BlendStructDNA
 
-        rewind_offset = self.handle.seek(0, 1)
-        data = self.handle.read(head.size)
+        # The index is read from a view of the memory map, only the names are copied when they are split
+        data = memoryview(self.data)[offset:offset+head.size]
+
+        # Files saved by the same blender version have the same index, it is only parsed once
+        dna = data.tobytes()
+        key = (self.header.endian, self.header.arch, dna)
+        index = BlenderFile.INDEX_CACHE.get(key)
+        if index is not None:
+            return index
+
         if data[0:8] != b'SDNANAME':
             raise BlenderFileImportException('Malformed index')
 
         # Reading the blend file names
         offset = 8
-        name_count = Int.unpack_from(data, offset).val
-        field_names = [n.decode('utf-8') for n in data[offset+4::].split(b'\x00', name_count)[:-1]]
+        name_count, = read_int(data, offset)
+        field_names, offset = BlenderFile._read_names(data, offset+4, name_count)
 
-        # Reading the blend file types
-        offset += sum((len(n) for n in field_names))+len(field_names)+4; align()         # Size of all names + size of all null char + name_count offset and Align the offset at 4 bytes
+        # Reading the blend file types. The sections are aligned on 4 bytes
+        offset = (offset+3) & ~3
         if data[offset:offset+4] != b'TYPE':
             raise BlenderFileImportException('Malformed index')
 
-        type_count = Int.unpack_from(data, offset+4).val
-        type_names = [n.decode('utf-8') for n in data[offset+8::].split(b'\x00', type_count)[:-1]]
+        type_count, = read_int(data, offset+4)
+        type_names, offset = BlenderFile._read_names(data, offset+8, type_count)
 
         # Reading the types length
-        offset += sum((len(t) for t in type_names))+len(type_names)+8; align()
+        offset = (offset+3) & ~3
         if data[offset:offset+4] != b'TLEN':
             raise BlenderFileImportException('Malformed index')
 
         offset += 4
-        type_data_length = Short.format.size * type_count
-        type_sizes = (x.val for x in Short.iter_unpack(data[offset:offset+type_data_length]))
+        type_sizes_fmt = _make_struct(self._fmt_strct('{}h'.format(type_count)))
+        type_data_length = type_sizes_fmt.size
+        type_sizes = type_sizes_fmt.unpack_from(data, offset)
 
         # Reading structures information
-        offset += type_data_length; align()
+        offset = (offset+type_data_length+3) & ~3
         if data[offset:offset+4] != b'STRC':
             raise BlenderFileImportException('Malformed index')
 
+        # The fields of a structure are read in one call, as a flat list of (type, name) values
         offset += 8
         structures = []
-        structure_count = Int.unpack_from(data, offset-4).val
+        structure_count, = read_int(data, offset-4)
+        make_field, fields_fmt = BlendStructFieldDNA.names._make, self._fmt_strct('{}h')
+        read_structure_head, make_struct, add_structure = BlendStructFieldDNA.format.unpack_from, _make_struct, structures.append
         for _ in range(structure_count):
-            structure_type_index = Short.unpack_from(data, offset).val
-
-            field_count = Short.unpack_from(data, offset+2).val
-            fields = []
-            offset += 4
-            for _ in range(field_count):
-                fields.append(BlendStructFieldDNA.unpack_from(data, offset))
-                offset += 4
-            
-            structures.append(BlendStructDNA(index=structure_type_index, fields=tuple(fields)))
+            # The type index and the field count of a structure have the same layout as a field
+            structure_type_index, field_count = read_structure_head(data, offset)
 
-        # Rewind the blend at the end of the block head
-        self.handle.seek(rewind_offset, 0)
+            values = make_struct(fields_fmt.format(field_count*2)).unpack_from(data, offset+4)
+            fields = tuple(map(make_field, zip(values[0::2], values[1::2])))
+            offset += 4 + field_count*4
+            
+            add_structure(BlendStructDNA(index=structure_type_index, fields=fields))
 
-        return BlenderFile.BlendIndex(
-            field_names=tuple(field_names),
-            type_names=tuple(type_names),
+        index = BlenderFile.BlendIndex(
+            field_names=NameTable(field_names),
+            type_names=NameTable(type_names),
             type_sizes=tuple(type_sizes),
-            structures=tuple(structures)
+            structures=tuple(structures),
+            structures_by_type={s.index: position for position, s in enumerate(structures)},
+            dna=dna
         )
+        BlenderFile.INDEX_CACHE[key] = index
+
+        return index
 
 
     def _parse_blocks(self):
@@ -671,31 +1032,31 @@ class BlenderFile(object):
 
             Author: Gabriel Dube
         """
-        handle = self.handle
+        data = self.data
         BlendBlockHeader = NamedStruct.from_namedtuple(BlenderFile.BlendBlockHeader, self._fmt_strct('4siPii'))
-        header_block_size = BlendBlockHeader.format.size
+        unpack_from, header_block_size = BlendBlockHeader.unpack_from, BlendBlockHeader.format.size
 
-        # Get the blend file size
-        end = handle.seek(0, 2)
-        handle.seek(12, 0)
+        # The block headers are read directly from the memory map, after the file header
+        end = len(data)
+        offset = 12
 
         blend_index = None
         end_found = False
         file_block_heads = []
-        while end != handle.seek(0, 1) and not end_found:
-            buf = handle.read(header_block_size)
-            file_block_head = BlendBlockHeader.unpack(buf)
+        while offset + header_block_size <= end and not end_found:
+            file_block_head = unpack_from(data, offset)
+            offset += header_block_size
             
             # DNA1 indicates the index block of the blend file
             # ENDB indicates the end of the blend file
             if file_block_head.code == b'DNA1':
-                blend_index = self._parse_index(file_block_head)
+                blend_index = self._parse_index(file_block_head, offset)
             elif file_block_head.code == b'ENDB':
                 end_found = True
             else:
-                file_block_heads.append((file_block_head, handle.seek(0, 1)))
+                file_block_heads.append((file_block_head, offset))
 
-            handle.seek(file_block_head.size, 1)
+            offset += file_block_head.size
         
         if blend_index is None:
             raise BlenderFileImportException('Could not find blend file index')
@@ -707,14 +1068,11 @@ class BlenderFile(object):
 
     def _read_block(self, block, offset):
         """
-            Read a block data and return it.
+            Read a block data and return it. The data is a memoryview over the file memory map, it is not copied.
 
             Author: Gabriel Dube
         """
-        handle = self.handle
-        handle.seek(offset, 0)
-        data = handle.read(block.size)
-        return data 
+        return memoryview(self.data)[offset:offset+block.size]
 
     def _from_address(self, ptr):
         """
@@ -723,11 +1081,7 @@ class BlenderFile(object):
 
             Author: Gabriel Dube
         """
-        block, offset  = None, None
-        for _block, _offset in self.blocks:
-            if _block.addr == ptr:
-                block, offset  = _block, _offset
-
+        block, offset = self.blocks_by_address.get(ptr, (None, None))
         if offset is None:
             raise BlenderFileReadException('Cannot find the address {} in the blend file'.format(hex(ptr)))
 
@@ -739,7 +1093,7 @@ class BlenderFile(object):
         else:
             ref_self = ref(self)
             step = obj.FMT.format.size
-            return tuple([obj(ref_self, block_data[x:x+step]) for x in range(0, block.size, step) ])
+            return tuple([obj(ref_self, block_data, x) for x in range(0, block.size, step) ])
 
     def _from_addresses(self, ptr_list):
         return [self._from_address(ptr) if ptr != 0 else None for ptr in ptr_list]
@@ -755,12 +1109,25 @@ class BlenderFile(object):
         if header is None:
             raise BlenderFileImportException('Bad file header')
 
+        # The block headers are read from the start to the end of the file. Not available on every platform
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
         self.header = header
         self.handle = handle
+        self.data = mmap(handle.fileno(), 0, access=ACCESS_READ)
         self.blocks, self.index = self._parse_blocks()
+        self.sdna_counts = Counter(block.sdna for block, offset in self.blocks)
+
+        self.blocks_by_sdna = {}
+        for block in self.blocks:
+            self.blocks_by_sdna.setdefault(block[0].sdna, []).append(block)
+
+        # If two blocks share an address, the last one is used
+        self.blocks_by_address = {block.addr: (block, offset) for block, offset in self.blocks}
 
-        if BlenderObjectFactory.CACHE.get(header.version) is None:
-            BlenderObjectFactory.CACHE[header.version] = {}
+        # Factories created by list. Dict of {TYPE_NAME: BlenderObjectFactory}
+        self.factories = {}
 
     def list(self, factory_name):
         """
@@ -772,18 +1139,15 @@ class BlenderFile(object):
 
             author: Gabriel Dube
         """
-        version = self.header.version
-        factories = BlenderObjectFactory.CACHE.get(version)
-
         # If the factory was already created
-        fact = (factories.get(factory_name) or (lambda:None))()
+        fact = self.factories.get(factory_name)
         if fact is not None:
             return fact
 
         # Factory creation
         try:
             fact = BlenderObjectFactory(self, self.index.type_names.index(factory_name))
-            factories[factory_name] = ref(fact)
+            self.factories[factory_name] = fact
             return fact
         except ValueError:
             raise BlenderFileReadException('Data type {} could not be found in the blend file'.format(factory_name))
@@ -809,7 +1173,7 @@ class BlenderFile(object):
 
         field_names = self.index.field_names
         type_names = self.index.type_names
-        struct_indexes = [s.index for s in self.index.structures]
+        struct_indexes = self.index.structures_by_type
         
         type_index = type_names.index(type_name)
         dna = self._struct_lookup(type_index)
@@ -828,4 +1192,12 @@ class BlenderFile(object):
         return sorted(names)
 
     def close(self):
+        self.factories.clear()
+
+        # The memory map cannot be closed while a block data is referenced, it is then closed when it is freed
+        try:
+            self.data.close()
+        except BufferError:
+            pass
+
         self.handle.close()